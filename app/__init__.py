@@ -1,23 +1,73 @@
+from collections.abc import Mapping
+
+import click
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 
-from app.extensions import db, migrate
-from app.settings import Config
+from app.commands import register_commands
+from app.database import configure_engines
+from app.extensions import category_cache, db, xlsx_export
+from app.idempotency import idempotency_store
+from app.json_provider import FastJSONProvider
+from app.metrics import metrics
+from app.passwords import password_hasher
+from app.permissions import permission_cache
+from app.purge import purge_worker
+from app.query_counter import query_counter
+from app.rate_limit import login_rate_limiter
+from app.response_cache import response_cache
+from app.roles import role_registry
+from app.settings import DefaultConfig, env_config
+from routes.order_routes import order_blueprint
 from routes.product_routes import product_blueprint
 from routes.user_routes import user_blueprint
 
 
-def create_app():
+def create_app(config_object=None, **overrides):
+    """Build the app.
+
+    Without ``config_object`` settings come from the environment (see
+    ``app.settings.env_config``). A class, object or mapping replaces that
+    source entirely; ``overrides`` are applied last either way. Defaults
+    from ``DefaultConfig`` fill in anything not given.
+    """
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     CORS(app)
-    app.config.from_object(Config)
+    app.config.from_object(DefaultConfig)
+    if config_object is None:
+        app.config.update(env_config())
+    elif isinstance(config_object, Mapping):
+        app.config.update(config_object)
+    else:
+        app.config.from_object(config_object)
+    app.config.update(overrides)
     JWTManager(app)
 
+    configure_engines(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    # Flask-Migrate тянет за собой alembic (~0.2 с на импорт), а нужен только
+    # командам `flask db`: воркеры и тесты его не загружают
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+
+        Migrate(app, db)
+    xlsx_export.init_app(app)
+    category_cache.init_app(app)
+    response_cache.init_app(app)
+    idempotency_store.init_app(app)
+    purge_worker.init_app(app)
+    password_hasher.init_app(app)
+    permission_cache.init_app(app)
+    role_registry.init_app(app)
+    login_rate_limiter.init_app(app)
+    metrics.init_app(app)
+    query_counter.init_app(app)
 
     app.register_blueprint(user_blueprint, url_prefix="/users")
     app.register_blueprint(product_blueprint, url_prefix="/products")
+    app.register_blueprint(order_blueprint, url_prefix="/orders")
+    register_commands(app)
 
     return app
@@ -0,0 +1,67 @@
+from flask import request
+from sqlalchemy import select
+
+from app.catalog_import import INT_MAX
+from app.extensions import db
+
+MAX_BATCH_IDS = 100
+
+
+class InvalidIds(ValueError):
+    pass
+
+
+def parse_ids(limit=MAX_BATCH_IDS):
+    """Unique positive ids from ``?ids=3,1,2`` (or repeated ``ids``), in order."""
+    ids = []
+    for value in request.args.getlist("ids"):
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                item_id = int(part)
+            except ValueError:
+                raise InvalidIds(part)
+            # Иначе драйвер базы падает на переполнении и запрос получает 500
+            if not 0 < item_id <= INT_MAX:
+                raise InvalidIds(part)
+            ids.append(item_id)
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > limit:
+        raise InvalidIds(ids)
+    return ids
+
+
+def get_by_ids(columns, ids):
+    """Rows of ``columns`` as dicts in the order of ``ids``, None for misses.
+
+    ``columns[0]`` is the primary key. Ids not seen earlier in the request
+    are fetched with a single ``IN`` query; hits and misses are both kept
+    in a request-scoped identity cache, so later lookups of the same rows
+    within the request cost nothing.
+    """
+    primary_key = columns[0]
+    # Храним в environ, а не в g: g живет в контексте приложения, который
+    # может быть общим для нескольких запросов (например, в тестах)
+    cache = request.environ.setdefault("shop.identity_cache", {}).setdefault(
+        (primary_key.class_.__tablename__, tuple(c.key for c in columns)), {}
+    )
+
+    wanted = [item_id for item_id in ids if item_id not in cache]
+    if wanted:
+        rows = db.session.execute(select(*columns).where(primary_key.in_(wanted)))
+        found = {row[0]: row._asdict() for row in rows}
+        for item_id in wanted:
+            cache[item_id] = found.get(item_id)
+    return [cache[item_id] for item_id in ids]
+
+
+def batch_payload(name, columns):
+    """``{name: [row or None, ...], "missing": [id, ...]}`` for ``?ids=``."""
+    ids = parse_ids()
+    items = get_by_ids(columns, ids)
+    return {
+        name: items,
+        "missing": [item_id for item_id, item in zip(ids, items) if item is None],
+    }
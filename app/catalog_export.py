@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+import tempfile
+
+from sqlalchemy import select
+
+from app.extensions import db
+from app.metrics import metrics
+from models.product_models import Category, Product
+
+EXPORT_HEADERS = [
+    "Product ID",
+    "Name",
+    "Title",
+    "Price",
+    "Category ID",
+    "Category",
+    "Created_at",
+]
+NDJSON_KEYS = [
+    "id",
+    "name",
+    "title",
+    "price",
+    "category_id",
+    "category",
+    "created_at",
+]
+
+
+def iter_product_rows(chunk_size=1000):
+    """Yield export rows for the whole catalog through a server-side cursor.
+
+    ``yield_per`` makes the driver fetch ``chunk_size`` rows at a time, so
+    memory does not depend on the catalog size.
+    """
+    stmt = (
+        select(
+            Product.id,
+            Product.name,
+            Product.title,
+            Product.price,
+            Product.category_id,
+            Category.name,
+            Product.created_at,
+        )
+        .outerjoin(Category, Product.category_id == Category.id)
+        .order_by(Product.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    yield from db.session.execute(stmt)
+
+
+def csv_chunks(rows, chunk_size=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, chunk_size=1000):
+    lines = []
+    for row in rows:
+        item = dict(zip(NDJSON_KEYS, row))
+        if item["created_at"] is not None:
+            item["created_at"] = item["created_at"].isoformat()
+        lines.append(json.dumps(item, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def xlsx_file(rows):
+    """Write rows with openpyxl's write-only workbook into a temporary file.
+
+    A write-only worksheet streams rows to disk instead of keeping cells in
+    memory. The returned file is positioned at the start and is removed once
+    it is closed.
+    """
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Products")
+    worksheet.append(EXPORT_HEADERS)
+    for row in rows:
+        worksheet.append(list(row))
+
+    output = tempfile.TemporaryFile()
+    with metrics.timer("xlsx_catalog_export"):
+        workbook.save(output)
+    output.seek(0)
+    return output
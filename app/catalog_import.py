@@ -0,0 +1,211 @@
+import csv
+import io
+import json
+import zipfile
+
+from sqlalchemy import insert, select
+
+from app.extensions import db
+from app.response_cache import category_tag, mark_products_changed
+from models.product_models import Category, Product, record_bulk_insert
+
+IMPORT_FORMATS = ("csv", "ndjson", "xlsx")
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+NAME_MAX_LENGTH = 150
+# Границы колонок Integer (32 бита), в которые пишутся цена, остаток и категория
+INT_MIN, INT_MAX = -(2**31), 2**31 - 1
+
+
+def detect_format(filename, requested=None):
+    if requested:
+        return requested if requested in IMPORT_FORMATS else None
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension == "jsonl":
+        extension = "ndjson"
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    # Строка 1 - заголовок, нумерация как в файле
+    for row_number, row in enumerate(csv.DictReader(text), start=2):
+        yield row_number, row
+
+
+def read_ndjson(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8")
+    for row_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row_number, row if isinstance(row, dict) else "Invalid JSON"
+
+
+def read_xlsx(stream):
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True)
+    except InvalidFileException as e:
+        raise ValueError(str(e)) from e
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = [
+            str(cell).strip() if cell is not None else "" for cell in next(rows, ())
+        ]
+        for row_number, values in enumerate(rows, start=2):
+            if all(value is None for value in values):
+                continue
+            yield row_number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson, "xlsx": read_xlsx}
+
+
+class InvalidImportFile(ValueError):
+    pass
+
+
+def read_rows(file_format, stream):
+    try:
+        yield from READERS[file_format](stream)
+    except (
+        ValueError,
+        csv.Error,
+        zipfile.BadZipFile,
+        KeyError,
+    ) as e:
+        raise InvalidImportFile(str(e)) from e
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        number = int(value)
+    else:
+        number = int(str(value).strip())
+    if not INT_MIN <= number <= INT_MAX:
+        raise ValueError(value)
+    return number
+
+
+def validate_row(row, category_ids):
+    """Return ``(values, None)`` for a valid row or ``(None, error)``."""
+    missing = [
+        field for field in ("name", "title", "price") if row.get(field) in (None, "")
+    ]
+    if missing:
+        return None, f"Missing fields: {', '.join(missing)}"
+
+    name, title = str(row["name"]), str(row["title"])
+    if len(name) > NAME_MAX_LENGTH or len(title) > NAME_MAX_LENGTH:
+        return None, "Name or title is too long"
+
+    try:
+        price = _to_int(row["price"])
+    except (TypeError, ValueError):
+        return None, "Invalid price"
+
+    stock = row.get("stock")
+    if stock in (None, ""):
+        stock = 0
+    else:
+        try:
+            stock = _to_int(stock)
+        except (TypeError, ValueError):
+            return None, "Invalid stock"
+        if stock < 0:
+            return None, "Invalid stock"
+
+    category_id = row.get("category_id")
+    if category_id in (None, ""):
+        category_id = None
+    else:
+        try:
+            category_id = _to_int(category_id)
+        except (TypeError, ValueError):
+            return None, "Invalid category_id"
+        if category_id not in category_ids:
+            return None, "Category id not found"
+
+    return {
+        "name": name,
+        "title": title,
+        "price": price,
+        "stock": stock,
+        "category_id": category_id,
+    }, None
+
+
+def import_products(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """Validate ``(row_number, row)`` pairs and insert valid ones in chunks.
+
+    Category ids are loaded once up front, and every chunk is a single
+    executemany INSERT committed on its own, so a large feed never holds one
+    long transaction. If the file turns out to be unreadable after some rows
+    were read, the valid rows so far are still inserted and the report gets
+    a file-level error with ``"row": None``; if nothing could be read at all,
+    ``InvalidImportFile`` is raised and nothing is written.
+    """
+    category_ids = set(db.session.scalars(select(Category.id)))
+    report = {"total": 0, "inserted": 0, "error_count": 0, "errors": []}
+    chunk = []
+
+    def flush():
+        if chunk:
+            # Core-вставка не вызывает событий модели: историю цен и
+            # category_stats дописываем сами в той же транзакции
+            rows = db.session.execute(
+                insert(Product).returning(
+                    Product.id, Product.category_id, Product.price
+                ),
+                chunk,
+            ).all()
+            record_bulk_insert(db.session.connection(), rows)
+            mark_products_changed(
+                db.session, {category_tag(values["category_id"]) for values in chunk}
+            )
+            db.session.commit()
+            report["inserted"] += len(chunk)
+            chunk.clear()
+
+    def add_error(row_number, error):
+        report["error_count"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "error": error})
+
+    try:
+        for row_number, row in rows:
+            report["total"] += 1
+            if isinstance(row, dict):
+                values, error = validate_row(row, category_ids)
+            else:
+                values, error = None, row
+
+            if error:
+                add_error(row_number, error)
+                continue
+
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                flush()
+    except InvalidImportFile as e:
+        if not report["total"]:
+            raise
+        # Предыдущие чанки уже закоммичены, поэтому вместо 400 отдаем
+        # отчет о том, что успели вставить, и ошибку всего файла
+        add_error(None, f"Invalid file: {e}")
+
+    flush()
+    return report
@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+
+from flask import Response, current_app, request
+from sqlalchemy import select
+
+
+class CategoryCache:
+    """In-process copy of the whole category table.
+
+    The snapshot is loaded on first use and dropped by ``invalidate()``, which
+    also bumps ``version``. Serialized responses are kept per version together
+    with their ETag, so a repeated read is a dict lookup and a matching
+    ``If-None-Match`` gets a 304 without serializing anything. ``ttl`` bounds
+    how long a worker may serve a tree changed by another process.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._responses = {}
+
+    def init_app(self, app):
+        self.ttl = app.config.get("CATEGORY_CACHE_TTL", self.ttl)
+        app.extensions["category_cache"] = self
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+            self._responses = {}
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is not None and (
+                time.monotonic() - self._loaded_at < self.ttl
+            ):
+                return self._snapshot
+            if self._snapshot is not None:
+                # TTL истек: считаем это такой же инвалидацией
+                self.version += 1
+                self._responses = {}
+            self._snapshot = self._load()
+            self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def _load(self):
+        from app.extensions import db
+        from app.serializers import CATEGORY_COLUMNS
+        from models.product_models import Category
+
+        rows = db.session.execute(
+            select(*CATEGORY_COLUMNS, Category.path).order_by(Category.id)
+        ).all()
+        categories = []
+        for row in rows:
+            data = row._asdict()
+            categories.append((data, data.pop("path")))
+        children = {}
+        for data, _ in categories:
+            children.setdefault(data["parent_id"], []).append(data["id"])
+        return {
+            "categories": categories,
+            "by_id": {data["id"]: (data, path) for data, path in categories},
+            "children": children,
+        }
+
+    def categories(self, parent_id=None):
+        snapshot = self.snapshot()
+        if parent_id is None:
+            return [data for data, _ in snapshot["categories"]]
+        by_id = snapshot["by_id"]
+        return [
+            by_id[child_id][0] for child_id in snapshot["children"].get(parent_id, [])
+        ]
+
+    def get(self, category_id):
+        entry = self.snapshot()["by_id"].get(category_id)
+        return entry[0] if entry else None
+
+    def subtree_ids(self, root_id):
+        snapshot = self.snapshot()
+        root_path = snapshot["by_id"][root_id][1] or ""
+        return [
+            data["id"]
+            for data, path in snapshot["categories"]
+            if data["id"] == root_id or (path or "").startswith(root_path)
+        ]
+
+    def tree(self, root_id=None):
+        snapshot = self.snapshot()
+        # Сортировка по path гарантирует, что родитель идет раньше потомков
+        categories = sorted(snapshot["categories"], key=lambda entry: entry[1] or "")
+        if root_id is not None:
+            root_path = snapshot["by_id"][root_id][1] or ""
+            categories = [
+                (data, path)
+                for data, path in categories
+                if data["id"] == root_id or (path or "").startswith(root_path)
+            ]
+
+        nodes = {}
+        roots = []
+        for data, _ in categories:
+            node = {
+                "id": data["id"],
+                "name": data["name"],
+                "parent_id": data["parent_id"],
+                "children": [],
+            }
+            nodes[data["id"]] = node
+            parent = nodes.get(data["parent_id"])
+            if parent is not None:
+                parent["children"].append(node)
+            else:
+                roots.append(node)
+        return roots
+
+    def response(self, key, build):
+        """Return a cached JSON response for ``key``, honouring If-None-Match."""
+        self.snapshot()
+        version = self.version
+        cached = self._responses.get(key)
+        if cached is None or cached[0] != version:
+            body = current_app.json.dumps(build()).encode()
+            etag = hashlib.md5(body).hexdigest()
+            cached = (version, body, etag)
+            self._responses[key] = cached
+
+        _, body, etag = cached
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        return response
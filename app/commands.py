@@ -0,0 +1,70 @@
+import click
+from flask.cli import with_appcontext
+
+from app.idempotency import idempotency_store
+from app.purge import purge_worker
+from app.roles import seed_roles
+from app.search import rebuild_search_index
+from models.product_models import rebuild_category_paths, rebuild_category_stats
+
+
+@click.command("rebuild-category-paths")
+@with_appcontext
+def rebuild_category_paths_command():
+    """Fill in the materialized path of every category."""
+    count = rebuild_category_paths()
+    click.echo(f"Rebuilt paths for {count} categories")
+
+
+@click.command("rebuild-category-stats")
+@with_appcontext
+def rebuild_category_stats_command():
+    """Recompute product counts and price aggregates of every category."""
+    count = rebuild_category_stats()
+    click.echo(f"Rebuilt stats for {count} categories")
+
+
+@click.command("seed-roles")
+@with_appcontext
+def seed_roles_command():
+    """Create roles, groups and group permissions."""
+    seed_roles()
+    click.echo("Roles, groups and permissions are seeded")
+
+
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    """Create the product search index and reindex all products."""
+    dialect = rebuild_search_index()
+    click.echo(f"Search index rebuilt for {dialect}")
+
+
+@click.command("purge-idempotency-keys")
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Delete expired idempotency keys in batches."""
+    total = 0
+    while True:
+        deleted = idempotency_store.purge_expired()
+        total += deleted
+        if deleted < idempotency_store.purge_batch:
+            break
+    click.echo(f"Purged {total} idempotency keys")
+
+
+@click.command("purge-deleted")
+@with_appcontext
+def purge_deleted_command():
+    """Remove soft-deleted categories and products in batches."""
+    count = purge_worker.run()
+    click.echo(f"Purged {count} rows")
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_category_paths_command)
+    app.cli.add_command(rebuild_category_stats_command)
+    app.cli.add_command(seed_roles_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+    app.cli.add_command(purge_deleted_command)
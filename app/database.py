@@ -0,0 +1,86 @@
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = ("GET", "HEAD")
+
+
+def engine_options(config, url):
+    """Engine keyword arguments for ``url`` built from the ``DB_*`` settings."""
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    backend = make_url(url).get_backend_name()
+
+    # SQLite использует StaticPool/однопоточный пул без размера очереди
+    if backend != "sqlite":
+        options.update(
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+        )
+
+    timeout = config["DB_STATEMENT_TIMEOUT_MS"]
+    if timeout:
+        if backend == "postgresql":
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+        elif backend == "mysql":
+            options["connect_args"] = {
+                "init_command": f"SET SESSION max_execution_time={timeout}"
+            }
+    return options
+
+
+def configure_engines(app):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS and create the replica engine.
+
+    The replica is a plain engine kept in ``app.extensions`` rather than a
+    Flask-SQLAlchemy bind: it holds the same tables as the primary, and a
+    bind would get its own metadata and be picked up by ``create_all``.
+    """
+    config = app.config
+    config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        engine_options(config, config["SQLALCHEMY_DATABASE_URI"]),
+    )
+
+    replica_url = config.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        app.extensions["db_replica"] = create_engine(
+            replica_url, **engine_options(config, replica_url)
+        )
+
+
+def replica_engine():
+    return current_app.extensions.get("db_replica")
+
+
+def use_primary():
+    """Send the rest of the current request's reads to the primary."""
+    g.db_use_primary = True
+
+
+class RoutingSession(Session):
+    """Session that sends reads of GET/HEAD requests to the replica engine.
+
+    Writes (INSERT/UPDATE/DELETE and flushes), work outside a request and
+    requests that called ``use_primary()`` stay on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return replica_engine()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if self._flushing or isinstance(clause, UpdateBase):
+            return False
+        return (
+            has_request_context()
+            and request.method in READ_METHODS
+            and not g.get("db_use_primary")
+            and replica_engine() is not None
+        )
@@ -1,5 +1,9 @@
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
-migrate = Migrate()
+from app.category_cache import CategoryCache
+from app.database import RoutingSession
+from app.xlsx_export import XlsxExportQueue
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+xlsx_export = XlsxExportQueue()
+category_cache = CategoryCache()
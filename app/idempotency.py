@@ -0,0 +1,272 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.query_counter import query_counter
+from models.idempotency_models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status_code", "content_type", "body", "expires_at")
+
+    def __init__(self, fingerprint, status_code, content_type, body, expires_at):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.content_type = content_type
+        self.body = body
+        self.expires_at = expires_at
+
+    def response(self):
+        response = Response(
+            self.body, status=self.status_code, content_type=self.content_type
+        )
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+
+
+class IdempotencyStore:
+    """Responses of write requests by ``Idempotency-Key``.
+
+    The ``idempotency_keys`` table is the source of truth shared by all
+    workers; finished responses are also kept in a per-process LRU so most
+    retries cost no query at all. A key is claimed by inserting its row
+    before the view runs, so a parallel retry gets 409 instead of running
+    the view twice. Rows live ``ttl`` seconds (``lock_timeout`` while the
+    first request runs) and are purged ``purge_batch`` at a time.
+    """
+
+    def __init__(
+        self,
+        ttl=86400,
+        lock_timeout=60,
+        maxsize=10000,
+        purge_every=100,
+        purge_batch=1000,
+    ):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.maxsize = maxsize
+        self.purge_every = purge_every
+        self.purge_batch = purge_batch
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._claims = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get("IDEMPOTENCY_TTL", self.ttl)
+        self.lock_timeout = app.config.get(
+            "IDEMPOTENCY_LOCK_TIMEOUT", self.lock_timeout
+        )
+        self.maxsize = app.config.get("IDEMPOTENCY_CACHE_SIZE", self.maxsize)
+        self.purge_every = app.config.get("IDEMPOTENCY_PURGE_EVERY", self.purge_every)
+        self.purge_batch = app.config.get("IDEMPOTENCY_PURGE_BATCH", self.purge_batch)
+        app.extensions["idempotency_store"] = self
+        self.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < datetime.utcnow():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def claim(self, key, fingerprint):
+        """Claim ``key`` for this request.
+
+        Returns None when the caller should run the view, otherwise the
+        stored row (``status_code`` is None while it is still running).
+        """
+        now = datetime.utcnow()
+        try:
+            db.session.execute(
+                insert(IdempotencyKey).values(
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.lock_timeout),
+                )
+            )
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        else:
+            self._purge_now_and_then()
+            return None
+
+        row = db.session.execute(
+            select(IdempotencyKey.__table__).where(IdempotencyKey.key == key)
+        ).first()
+        if row is not None and row.expires_at >= now:
+            return StoredResponse(
+                row.fingerprint,
+                row.status_code,
+                row.content_type,
+                row.body,
+                row.expires_at,
+            )
+
+        # Строка просрочена (например, воркер упал посреди запроса):
+        # перехватываем ее условным UPDATE, чтобы ключ достался одному запросу
+        taken = db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key, IdempotencyKey.expires_at < now)
+            .values(
+                fingerprint=fingerprint,
+                status_code=None,
+                content_type=None,
+                body=None,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.lock_timeout),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if taken:
+            return None
+        return StoredResponse(fingerprint, None, None, None, now)
+
+    def complete(self, key, fingerprint, response):
+        entry = StoredResponse(
+            fingerprint,
+            response.status_code,
+            response.content_type,
+            response.get_data(),
+            datetime.utcnow() + timedelta(seconds=self.ttl),
+        )
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(
+                status_code=entry.status_code,
+                content_type=entry.content_type,
+                body=entry.body,
+                expires_at=entry.expires_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        self.set(key, entry)
+
+    def release(self, key):
+        # Ошибку сервера не запоминаем: повтор с тем же ключом выполнится заново
+        db.session.rollback()
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        db.session.commit()
+
+    def purge_expired(self, limit=None):
+        """Delete up to ``limit`` expired rows; returns how many were deleted."""
+        expired = (
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at < datetime.utcnow())
+            .limit(limit or self.purge_batch)
+        )
+        deleted = db.session.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.key.in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    def _purge_now_and_then(self):
+        with self._lock:
+            self._claims += 1
+            due = self.purge_every and self._claims % self.purge_every == 0
+        if due:
+            with query_counter.paused():
+                self.purge_expired()
+
+
+idempotency_store = IdempotencyStore()
+
+
+def _scope():
+    # Ключи разных пользователей не пересекаются; без токена - общий скоуп
+    try:
+        verify_jwt_in_request(optional=True)
+    except (JWTExtendedException, PyJWTError):
+        return ""
+    identity = get_jwt_identity()
+    return "" if identity is None else str(identity)
+
+
+def idempotent(view):
+    """Replay the stored response of a request retried with the same key.
+
+    Put it below the auth decorators, so requests that fail auth never
+    claim a key. Without the ``Idempotency-Key`` header the view runs as is.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(IDEMPOTENCY_HEADER)
+        if header is None:
+            return view(*args, **kwargs)
+        if not header or len(header) > MAX_KEY_LENGTH:
+            return jsonify({"error": "Invalid Idempotency-Key"}), 400
+
+        key = hashlib.sha256(
+            f"{_scope()}\n{request.method} {request.path}\n{header}".encode()
+        ).hexdigest()
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        stored = idempotency_store.get(key)
+        if stored is None:
+            stored = idempotency_store.claim(key, fingerprint)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return (
+                    jsonify(
+                        {"error": "Idempotency-Key was used with a different request"}
+                    ),
+                    422,
+                )
+            if stored.status_code is None:
+                return (
+                    jsonify(
+                        {"error": "A request with this Idempotency-Key is in progress"}
+                    ),
+                    409,
+                )
+            return stored.response()
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(key)
+            raise
+        if response.status_code >= 500:
+            idempotency_store.release(key)
+        else:
+            idempotency_store.complete(key, fingerprint, response)
+        return response
+
+    return wrapper
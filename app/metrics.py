@@ -0,0 +1,205 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+IO_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+class Metrics:
+    """Per-endpoint request metrics in Prometheus text format.
+
+    Records latency histograms, SQL statement count and time (from engine
+    events), response size and time spent in ``timer()`` blocks such as
+    XLSX writes. Every response gets a ``Server-Timing`` header; ``/metrics``
+    serves the totals. Counters live in the process, so with several workers
+    each one reports its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listening = False
+        self.reset()
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_ENABLED", True)
+        app.extensions["metrics"] = self
+        self.reset()
+        if not app.config["METRICS_ENABLED"]:
+            return
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule("/metrics", "metrics", self.view)
+
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.latency = {}
+            self.db_statements = defaultdict(int)
+            self.db_seconds = defaultdict(float)
+            self.response_bytes = defaultdict(int)
+            self.io = {}
+
+    @contextmanager
+    def timer(self, operation):
+        """Time an I/O block; inside a request it also goes to Server-Timing."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                histogram = self.io.get(operation)
+                if histogram is None:
+                    histogram = self.io[operation] = Histogram(IO_BUCKETS)
+                histogram.observe(elapsed)
+            if has_request_context():
+                g.metrics_io = g.get("metrics_io", 0.0) + elapsed
+
+    @staticmethod
+    def _start():
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_statements = 0
+        g.metrics_db_seconds = 0.0
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info["metrics_started"] = time.perf_counter()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info.pop("metrics_started", None)
+        if started is not None and has_request_context() and "metrics_started" in g:
+            g.metrics_db_statements += 1
+            g.metrics_db_seconds += time.perf_counter() - started
+
+    def _finish(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None or request.endpoint == "metrics":
+            return response
+        elapsed = time.perf_counter() - started
+        db_seconds = g.metrics_db_seconds
+        io_seconds = g.get("metrics_io")
+
+        key = (request.method, request.endpoint or "unknown")
+        with self._lock:
+            self.requests[key + (response.status_code,)] += 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(elapsed)
+            self.db_statements[key] += g.metrics_db_statements
+            self.db_seconds[key] += db_seconds
+            # У потоковых ответов длина заранее неизвестна
+            self.response_bytes[key] += response.content_length or 0
+
+        timing = (
+            f"app;dur={elapsed * 1000:.2f}, "
+            f'db;dur={db_seconds * 1000:.2f};desc="{g.metrics_db_statements} queries"'
+        )
+        if io_seconds is not None:
+            timing += f", io;dur={io_seconds * 1000:.2f}"
+        response.headers.add("Server-Timing", timing)
+        return response
+
+    def render(self):
+        with self._lock:
+            lines = []
+            request_labels = ("method", "endpoint")
+
+            lines.append("# HELP http_requests_total Requests by endpoint and status.")
+            lines.append("# TYPE http_requests_total counter")
+            for key, value in sorted(self.requests.items()):
+                labels = _labels(("method", "endpoint", "status"), key)
+                lines.append(f"http_requests_total{{{labels}}} {value}")
+
+            lines.append("# HELP http_request_duration_seconds Request latency.")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for key, histogram in sorted(self.latency.items()):
+                lines.extend(
+                    _histogram_lines(
+                        "http_request_duration_seconds",
+                        _labels(request_labels, key),
+                        histogram,
+                    )
+                )
+
+            for name, help_text, values in (
+                (
+                    "http_request_db_statements_total",
+                    "SQL statements run by requests.",
+                    self.db_statements,
+                ),
+                (
+                    "http_request_db_seconds_total",
+                    "Time spent in SQL statements by requests.",
+                    self.db_seconds,
+                ),
+                (
+                    "http_response_size_bytes_total",
+                    "Bytes of response bodies with a known length.",
+                    self.response_bytes,
+                ),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(values.items()):
+                    lines.append(f"{name}{{{_labels(request_labels, key)}}} {value}")
+
+            lines.append("# HELP io_duration_seconds Time of I/O operations.")
+            lines.append("# TYPE io_duration_seconds histogram")
+            for operation, histogram in sorted(self.io.items()):
+                lines.extend(
+                    _histogram_lines(
+                        "io_duration_seconds", f'operation="{operation}"', histogram
+                    )
+                )
+        return "\n".join(lines) + "\n"
+
+    def view(self):
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+
+def _histogram_lines(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+    yield f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}'
+    yield f"{name}_sum{{{labels}}} {histogram.sum}"
+    yield f"{name}_count{{{labels}}} {histogram.count}"
+
+
+metrics = Metrics()
@@ -0,0 +1,21 @@
+import sys
+
+
+def gevent_patched():
+    """True in a gevent worker, where ``threading`` is monkey-patched."""
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def run_in_native_thread(func, *args):
+    """Call ``func(*args)``; under gevent, in a native thread of the hub pool.
+
+    A monkey-patched worker turns threads into greenlets, and CPU-bound work
+    such as password hashing or an openpyxl save done in a greenlet would
+    stall every other request of the process.
+    """
+    if gevent_patched():
+        from gevent import get_hub
+
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
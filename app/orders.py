@@ -0,0 +1,105 @@
+from sqlalchemy import case, delete, insert, select, update
+
+from app.extensions import db
+from app.response_cache import category_tag, mark_products_changed, product_tag
+from models.order_models import Cart, CartItem, Order, OrderItem
+from models.product_models import Product, product_is_live
+
+MAX_ORDER_ITEMS = 100
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+def parse_items(items):
+    """Turn ``[{"product_id": 1, "quantity": 2}, ...]`` into ``{1: 2}``.
+
+    Repeated products are summed. Returns None if the list is invalid.
+    """
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_ORDER_ITEMS:
+        return None
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        product_id, quantity = item.get("product_id"), item.get("quantity", 1)
+        if not all(
+            isinstance(value, int) and not isinstance(value, bool)
+            for value in (product_id, quantity)
+        ):
+            return None
+        if quantity < 1:
+            return None
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def cart_quantities(user_id):
+    rows = db.session.execute(
+        select(CartItem.product_id, CartItem.quantity)
+        .join(Cart, Cart.id == CartItem.cart_id)
+        .where(Cart.user_id == user_id)
+    ).all()
+    return dict(rows)
+
+
+def clear_cart(user_id):
+    cart_ids = select(Cart.id).where(Cart.user_id == user_id).scalar_subquery()
+    db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_ids))
+
+
+def place_order(user_id, quantities):
+    """Take stock for every line and add the order to the current transaction.
+
+    All lines are taken by one conditional ``UPDATE ... WHERE stock >= qty
+    RETURNING``: the database checks and decrements each row under its row
+    lock, so there is no read before the write and parallel checkouts can't
+    oversell. If fewer rows come back than were asked for, ``OutOfStock``
+    lists the missing products and the caller rolls the transaction back.
+    The caller also commits.
+    """
+    quantity = case(quantities, value=Product.id)
+    rows = db.session.execute(
+        update(Product)
+        .where(
+            Product.id.in_(quantities),
+            Product.stock >= quantity,
+            product_is_live(Product),
+        )
+        .values(stock=Product.stock - quantity)
+        .returning(Product.id, Product.price, Product.category_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    taken = {row.id: row for row in rows}
+    if len(taken) != len(quantities):
+        raise OutOfStock(sorted(set(quantities) - set(taken)))
+
+    items = [
+        {
+            "product_id": product_id,
+            "quantity": quantities[product_id],
+            "price": taken[product_id].price,
+        }
+        for product_id in sorted(quantities)
+    ]
+    order = Order(
+        user_id=user_id,
+        total=sum(item["price"] * item["quantity"] for item in items),
+    )
+    db.session.add(order)
+    db.session.flush()
+    db.session.execute(
+        insert(OrderItem), [dict(item, order_id=order.id) for item in items]
+    )
+
+    # UPDATE в обход ORM не вызывает событий модели, поэтому теги кэша
+    # ответов помечаем сами
+    mark_products_changed(
+        db.session,
+        {product_tag(row.id) for row in rows}
+        | {category_tag(row.category_id) for row in rows},
+    )
+    return order, items
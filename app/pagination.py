@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import literal, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort, order, value, last_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps({"s": sort, "o": order, "v": value, "id": last_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor, sort, order):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, last_id = payload["v"], payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    # Подделанный курсор не должен дойти до базы и вернуть 500
+    if not _is_int(last_id):
+        raise InvalidCursor(cursor)
+
+    # Курсор валиден только для той сортировки, с которой он был выдан
+    if payload.get("s") != sort or payload.get("o") != order:
+        raise InvalidCursor(cursor)
+
+    if sort == "created_at":
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise InvalidCursor(cursor)
+    elif not _is_int(value):
+        raise InvalidCursor(cursor)
+    return value, last_id
+
+
+def keyset_order(query, sort_column, id_column, sort, order, cursor=None):
+    """Order ``query`` by ``(sort_column, id_column)`` starting after ``cursor``."""
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort, order)
+        key = tuple_(sort_column, id_column)
+        bound = tuple_(
+            literal(value, sort_column.type), literal(last_id, id_column.type)
+        )
+        if order == "desc":
+            query = query.filter(key < bound)
+        else:
+            query = query.filter(key > bound)
+
+    if order == "desc":
+        return query.order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(sort_column.asc(), id_column.asc())
+
+
+def keyset_page(query, sort_column, id_column, sort, order, limit, cursor=None):
+    """Return one page of ``query`` ordered by ``(sort_column, id_column)``.
+
+    The page is located with a row-value comparison against the last seen key
+    instead of an OFFSET, so every page is a single index range scan.
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    query = keyset_order(query, sort_column, id_column, sort, order, cursor)
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            sort, order, getattr(last, sort_column.key), last.id
+        )
+    return rows, next_cursor
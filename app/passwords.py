@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app
+from sqlalchemy import update
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.native_threads import run_in_native_thread
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASH_METHOD = "scrypt"
+
+
+class HasherBusy(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=16)
+def hash_prefix(method):
+    """Full parameter string werkzeug writes for ``method``.
+
+    ``"scrypt"`` expands to ``"scrypt:32768:8:1"``, ``"pbkdf2"`` to
+    ``"pbkdf2:sha256:600000"`` and so on; computed once per method.
+    """
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def current_hash_method():
+    return current_app.config.get("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD)
+
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method=method or current_hash_method())
+
+
+def needs_rehash(password_hash, method):
+    return password_hash.split("$", 1)[0] != hash_prefix(method)
+
+
+class PasswordHasher:
+    """Bounded thread pool for password verification.
+
+    At most ``workers`` hashes run at once and at most ``max_pending``
+    verifications may wait; beyond that ``verify`` raises ``HasherBusy``
+    right away instead of letting a flood of logins pin the process.
+    hashlib releases the GIL while hashing, so the pool uses several cores.
+    """
+
+    def __init__(self, workers=None, max_pending=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS") or self.workers
+        self.max_pending = app.config.get("PASSWORD_HASH_MAX_PENDING", self.max_pending)
+        app.extensions["password_hasher"] = self
+        self.shutdown()
+
+    def _ensure_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._slots = threading.BoundedSemaphore(
+                        self.workers + self.max_pending
+                    )
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="password-hash"
+                    )
+        return self._executor
+
+    def submit(self, func, *args):
+        executor = self._ensure_executor()
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        future = executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def verify(self, password_hash, password):
+        return self.submit(
+            run_in_native_thread, check_password_hash, password_hash, password
+        ).result()
+
+    def rehash_in_background(self, user_id, old_hash, password, method):
+        app = current_app._get_current_object()
+        try:
+            self.submit(self._rehash, app, user_id, old_hash, password, method)
+        except HasherBusy:
+            # Перехешируем при следующем входе
+            pass
+
+    @staticmethod
+    def _rehash(app, user_id, old_hash, password, method):
+        from app.extensions import db
+        from models.user_models import User
+
+        new_hash = run_in_native_thread(generate_password_hash, password, method)
+        with app.app_context():
+            try:
+                # Условие на старый хеш: не затираем пароль, смененный параллельно
+                db.session.execute(
+                    update(User)
+                    .where(User.id == user_id, User.password_hash == old_hash)
+                    .values(password_hash=new_hash)
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Password rehash for user %s failed", user_id)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = None
+            self._slots = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import db
+from models.user_models import Permission, PermissionGroup, Role, User
+
+
+class PermissionCache:
+    """TTL + LRU cache of ``user_id -> (role, permissions)``."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get("PERMISSION_CACHE_SIZE", self.maxsize)
+        self.ttl = app.config.get("PERMISSION_CACHE_TTL", self.ttl)
+        app.extensions["permission_cache"] = self
+        self.invalidate()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return value
+
+    def set(self, user_id, value):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+permission_cache = PermissionCache()
+
+
+def load_user_permissions(user_id):
+    """Resolve role and group permissions of a user with a single query."""
+    rows = db.session.execute(
+        select(Role.name, Permission.name)
+        .select_from(User)
+        .join(Role, User.role_id == Role.id)
+        .outerjoin(PermissionGroup, PermissionGroup.group_id == User.group_id)
+        .outerjoin(Permission, PermissionGroup.permission_id == Permission.id)
+        .where(User.id == user_id)
+    ).all()
+    if not rows:
+        return None
+    role = rows[0][0]
+    permissions = frozenset(name for _, name in rows if name is not None)
+    return role, permissions
+
+
+def get_user_permissions(user_id):
+    cached = permission_cache.get(user_id)
+    if cached is None:
+        cached = load_user_permissions(user_id)
+        if cached is None:
+            return None
+        permission_cache.set(user_id, cached)
+    return cached
+
+
+def require_permission(permission):
+    def decorator(view):
+        @wraps(view)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            resolved = get_user_permissions(get_jwt_identity())
+            if resolved is None or permission not in resolved[1]:
+                return jsonify({"error": "Access denied"}), 403
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _mark_changed(target, user_id):
+    # Сбрасываем кэш только после commit, иначе параллельный запрос может
+    # успеть закэшировать старые права до фиксации транзакции
+    session = object_session(target)
+    if session is None:
+        return
+    pending = session.info.setdefault("permission_invalidations", set())
+    pending.add(user_id)
+
+
+@event.listens_for(PermissionGroup, "after_insert")
+@event.listens_for(PermissionGroup, "after_delete")
+def _group_permissions_changed(mapper, connection, target):
+    # Права группы затрагивают всех ее пользователей
+    _mark_changed(target, None)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    _mark_changed(target, target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    pending = session.info.pop("permission_invalidations", None)
+    if not pending:
+        return
+    if None in pending:
+        permission_cache.invalidate()
+    else:
+        for user_id in pending:
+            permission_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("permission_invalidations", None)
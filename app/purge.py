@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, delete, exists, or_, select, update
+
+from app.extensions import db
+from app.response_cache import category_tag, mark_products_changed, product_tag
+from models.order_models import CartItem, OrderItem
+from models.product_models import (
+    Category,
+    CategoryStats,
+    Product,
+    ProductPriceHistory,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def purge_products(batch_size):
+    """Hard-delete up to ``batch_size`` deleted products or products of
+    deleted categories, in one transaction. Returns how many were removed.
+    """
+    products = Product.__table__
+    categories = Category.__table__
+    rows = db.session.execute(
+        select(products.c.id, products.c.category_id)
+        .where(
+            # Обе ветви совпадают с условиями частичных индексов, поэтому
+            # поиск идет по индексу, а не по всей таблице
+            or_(
+                products.c.deleted_at.is_not(None),
+                and_(
+                    products.c.deleted_at.is_(None),
+                    products.c.category_id.in_(
+                        select(categories.c.id).where(
+                            categories.c.deleted_at.is_not(None)
+                        )
+                    ),
+                ),
+            )
+        )
+        .limit(batch_size)
+        .execution_options(include_deleted=True)
+    ).all()
+    if not rows:
+        return 0
+
+    product_ids = [row.id for row in rows]
+    # SQLite не проверяет внешние ключи, поэтому зависимые строки чистим сами
+    history = ProductPriceHistory.__table__
+    db.session.execute(delete(history).where(history.c.product_id.in_(product_ids)))
+    cart_items = CartItem.__table__
+    db.session.execute(
+        delete(cart_items).where(cart_items.c.product_id.in_(product_ids))
+    )
+    order_items = OrderItem.__table__
+    db.session.execute(
+        update(order_items)
+        .where(order_items.c.product_id.in_(product_ids))
+        .values(product_id=None)
+    )
+    db.session.execute(delete(products).where(products.c.id.in_(product_ids)))
+
+    # Закэшированные ответы со скрытыми продуктами больше не нужны
+    mark_products_changed(
+        db.session,
+        {product_tag(row.id) for row in rows}
+        | {category_tag(row.category_id) for row in rows},
+    )
+    db.session.commit()
+    return len(rows)
+
+
+def purge_categories(batch_size):
+    """Hard-delete up to ``batch_size`` deleted categories that have no
+    children and no products left, so subtrees go leaf first.
+    """
+    categories = Category.__table__
+    children = categories.alias("children")
+    products = Product.__table__
+    category_ids = db.session.scalars(
+        select(categories.c.id)
+        .where(
+            categories.c.deleted_at.is_not(None),
+            ~exists().where(children.c.parent_id == categories.c.id),
+            ~exists().where(
+                products.c.category_id == categories.c.id,
+                products.c.deleted_at.is_(None),
+            ),
+        )
+        .limit(batch_size)
+        .execution_options(include_deleted=True)
+    ).all()
+    if not category_ids:
+        return 0
+
+    stats = CategoryStats.__table__
+    db.session.execute(delete(stats).where(stats.c.category_id.in_(category_ids)))
+    db.session.execute(delete(categories).where(categories.c.id.in_(category_ids)))
+    db.session.commit()
+    return len(category_ids)
+
+
+def purge_batch(batch_size):
+    """Run one purge batch: products first, then the categories they freed."""
+    return purge_products(batch_size) or purge_categories(batch_size)
+
+
+class PurgeWorker:
+    """Hard-deletes soft-deleted categories and products in the background.
+
+    Deletes from the API only set ``deleted_at``. This daemon thread then
+    removes the rows ``batch_size`` at a time, each batch in its own short
+    transaction with ``pause`` seconds between batches, so a large subtree
+    never holds locks for long. The thread starts on the first ``wake()``
+    in a process and then also runs every ``interval`` seconds, picking up
+    deletes made through other workers.
+    """
+
+    def __init__(self, batch_size=500, pause=0.05, interval=300.0):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.enabled = True
+
+        self._app = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.last_run_at = None
+        self.purged_total = 0
+        self.last_error = None
+
+    def init_app(self, app):
+        self.batch_size = app.config.get("PURGE_BATCH_SIZE", self.batch_size)
+        self.pause = app.config.get("PURGE_BATCH_PAUSE", self.pause)
+        self.interval = app.config.get("PURGE_INTERVAL", self.interval)
+        self.enabled = app.config.get("PURGE_IN_BACKGROUND", self.enabled)
+        self._app = app
+        app.extensions["purge_worker"] = self
+        self.last_run_at = None
+        self.purged_total = 0
+        self.last_error = None
+
+    def wake(self):
+        if not self.enabled:
+            return
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def run(self):
+        """Purge everything deleted so far; returns the number of rows."""
+        total = 0
+        while True:
+            purged = purge_batch(self.batch_size)
+            if not purged:
+                break
+            total += purged
+            time.sleep(self.pause)
+        self.last_run_at = datetime.utcnow()
+        self.purged_total += total
+        return total
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # Как и у выгрузки XLSX, поток стартует лениво, уже после fork
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="purge", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if not self.enabled:
+                continue
+            try:
+                with self._app.app_context():
+                    self.run()
+                self.last_error = None
+            except Exception as e:
+                logger.exception("Purge of deleted rows failed")
+                self.last_error = str(e)
+
+
+purge_worker = PurgeWorker()
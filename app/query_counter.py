@@ -0,0 +1,111 @@
+import logging
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+UNLIMITED = None
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(statements):
+    """Set the statement budget of a view; ``UNLIMITED`` turns checks off.
+
+    Put it right under ``@blueprint.route`` so the registered function
+    carries the attribute.
+    """
+
+    def decorator(view):
+        view.query_budget = statements
+        return view
+
+    return decorator
+
+
+class QueryCounter:
+    """Counts SQL statements per request and flags N+1 patterns.
+
+    A request is reported when it runs more statements than its view's
+    budget, or repeats one statement shape more than ``QUERY_REPEAT_LIMIT``
+    times. Reports are logged; with ``QUERY_BUDGET_RAISE`` (on by default
+    in testing) they raise ``QueryBudgetExceeded`` so tests fail.
+    """
+
+    def __init__(self):
+        self._listening = False
+
+    def init_app(self, app):
+        app.config.setdefault("QUERY_BUDGET_DEFAULT", 10)
+        app.config.setdefault("QUERY_REPEAT_LIMIT", 3)
+        app.extensions["query_counter"] = self
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._record)
+            self._listening = True
+
+    @staticmethod
+    @contextmanager
+    def paused():
+        """Leave statements of one-off bootstrap work out of the request count."""
+        if not has_request_context():
+            yield
+            return
+        statements = g.pop("sql_statements", None)
+        try:
+            yield
+        finally:
+            if statements is not None:
+                g.sql_statements = statements
+
+    @staticmethod
+    def _start():
+        g.sql_statements = []
+
+    @staticmethod
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        statements = g.get("sql_statements")
+        if statements is not None:
+            statements.append(statement)
+
+    def _finish(self, response):
+        statements = g.pop("sql_statements", None)
+        if statements is None:
+            return response
+
+        config = current_app.config
+        if config.get("QUERY_COUNT_HEADER", current_app.testing):
+            response.headers["X-Query-Count"] = str(len(statements))
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, "query_budget", config["QUERY_BUDGET_DEFAULT"])
+        if budget is UNLIMITED:
+            return response
+
+        problems = []
+        if len(statements) > budget:
+            problems.append(f"{len(statements)} statements, budget is {budget}")
+        if statements:
+            shape, repeats = Counter(statements).most_common(1)[0]
+            if repeats > config["QUERY_REPEAT_LIMIT"]:
+                problems.append(f"statement repeated {repeats} times: {shape[:200]}")
+
+        if problems:
+            message = f"{request.method} {request.path}: " + "; ".join(problems)
+            if config.get("QUERY_BUDGET_RAISE", current_app.testing):
+                raise QueryBudgetExceeded(message)
+            logger.warning("Query budget exceeded: %s", message)
+        return response
+
+
+query_counter = QueryCounter()
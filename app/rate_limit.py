@@ -0,0 +1,115 @@
+import itertools
+import math
+import threading
+import time
+from collections import deque
+
+
+class MemoryBackend:
+    """Sliding-window log kept in a dict of deques inside the process."""
+
+    def __init__(self, sweep_every=1000):
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._calls = 0
+
+    def hit(self, key, limit, window, now):
+        with self._lock:
+            self._calls += 1
+            if self._calls % self._sweep_every == 0:
+                self._sweep(now, window)
+
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return False, hits[0] + window - now
+            hits.append(now)
+            return True, 0.0
+
+    def _sweep(self, now, window):
+        # Удаляем ключи без попаданий в окне, чтобы словарь не рос бесконечно
+        expired = [
+            key
+            for key, hits in self._hits.items()
+            if not hits or hits[-1] <= now - window
+        ]
+        for key in expired:
+            del self._hits[key]
+
+
+class RedisBackend:
+    """Sliding-window log in a Redis sorted set per key.
+
+    ``client`` only needs ``pipeline()``, ``zremrangebyscore``, ``zadd``,
+    ``zcard``, ``zrange``, ``zrem`` and ``expire``, so any redis-py
+    compatible client, or a fake one in tests, works.
+    """
+
+    def __init__(self, client, prefix="rate-limit:"):
+        self.client = client
+        self.prefix = prefix
+        self._counter = itertools.count()
+
+    def hit(self, key, limit, window, now):
+        key = self.prefix + key
+        member = f"{now}:{next(self._counter)}"
+
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zadd(key, {member: now})
+        pipe.zcard(key)
+        pipe.expire(key, math.ceil(window))
+        count = pipe.execute()[2]
+
+        if count > limit:
+            self.client.zrem(key, member)
+            oldest = self.client.zrange(key, 0, 0, withscores=True)
+            retry_after = oldest[0][1] + window - now if oldest else window
+            return False, retry_after
+        return True, 0.0
+
+
+class LoginRateLimiter:
+    """Per-email and per-IP limits on login attempts.
+
+    Checked before the user lookup and password hash, so over-limit attempts
+    cost neither a query nor hashing CPU.
+    """
+
+    def __init__(self, backend=None, per_email=5, per_ip=20, window=60):
+        self.backend = backend or MemoryBackend()
+        self.per_email = per_email
+        self.per_ip = per_ip
+        self.window = window
+
+    def init_app(self, app):
+        self.per_email = app.config.get("LOGIN_RATE_LIMIT_PER_EMAIL", self.per_email)
+        self.per_ip = app.config.get("LOGIN_RATE_LIMIT_PER_IP", self.per_ip)
+        self.window = app.config.get("LOGIN_RATE_LIMIT_WINDOW", self.window)
+
+        redis_url = app.config.get("LOGIN_RATE_LIMIT_REDIS_URL")
+        if redis_url:
+            import redis
+
+            self.backend = RedisBackend(redis.Redis.from_url(redis_url))
+        else:
+            self.backend = MemoryBackend()
+        app.extensions["login_rate_limiter"] = self
+
+    def check(self, email, ip):
+        """Record an attempt; return seconds to wait if it is over the limit."""
+        now = time.time()
+        checks = [(f"login:ip:{ip}", self.per_ip)]
+        if email:
+            checks.append((f"login:email:{str(email).lower()}", self.per_email))
+
+        for key, limit in checks:
+            allowed, retry_after = self.backend.hit(key, limit, self.window, now)
+            if not allowed:
+                return max(retry_after, 0.0)
+        return None
+
+
+login_rate_limiter = LoginRateLimiter()
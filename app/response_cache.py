@@ -0,0 +1,249 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models.product_models import Product
+
+# Тег записей, которые зависят от всех продуктов (списки без фильтра категории)
+ALL_PRODUCTS = "products:*"
+
+
+def category_tag(category_id):
+    return f"category:{category_id}"
+
+
+def product_tag(product_id):
+    return f"product:{product_id}"
+
+
+def cache_key():
+    """Path plus the query string with sorted arguments."""
+    return f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "last_modified", "tags", "expires_at")
+
+    def __init__(self, body, etag, last_modified, tags, expires_at):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.tags = tags
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """LRU of serialized product responses bounded by total body size.
+
+    Entries are tagged with the categories and products they were built
+    from; ``invalidate(tags)`` drops every entry sharing a tag, and entries
+    tagged ``ALL_PRODUCTS`` on any product write. ``max_bytes=0`` turns the
+    cache off, ``ttl`` bounds staleness caused by writes in other processes.
+    """
+
+    def __init__(self, max_bytes=0, ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get("RESPONSE_CACHE_MAX_BYTES", self.max_bytes)
+        self.ttl = app.config.get("RESPONSE_CACHE_TTL", self.ttl)
+        app.extensions["response_cache"] = self
+        self.invalidate()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, etag, last_modified, tags):
+        if len(body) > self.max_bytes:
+            return
+        entry = CachedResponse(
+            body, etag, last_modified, frozenset(tags), time.monotonic() + self.ttl
+        )
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags=None):
+        with self._lock:
+            if tags is None:
+                self._entries.clear()
+                self.size = 0
+                return
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if ALL_PRODUCTS in entry.tags or not entry.tags.isdisjoint(tags)
+            ]
+            for key in stale:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= len(entry.body)
+
+
+response_cache = ResponseCache()
+
+
+def _validators(source, last_modified):
+    etag = hashlib.md5(source.encode()).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+    return etag, last_modified
+
+
+def product_validators(query, key):
+    """ETag and Last-Modified of the products matched by ``query``.
+
+    One aggregate query: ``max(updated_at)`` catches inserts and updates,
+    the row count catches deletes.
+    """
+    count, last_modified = (
+        query.order_by(None)
+        .with_entities(func.count(Product.id), func.max(Product.updated_at))
+        .one()
+    )
+    return _validators(f"{key}|{count}|{last_modified}", last_modified)
+
+
+def page_validators(key, rows, next_cursor):
+    """ETag and Last-Modified of one page, from the ``id`` and ``updated_at``
+    of its rows and the cursor of the next page.
+
+    Unlike ``product_validators`` this costs no query of its own, so it
+    stays cheap however large the filtered set behind the page is.
+    """
+    parts = [key, str(next_cursor)]
+    parts.extend(f"{row.id}:{row.updated_at}" for row in rows)
+    last_modified = max(
+        (row.updated_at for row in rows if row.updated_at is not None), default=None
+    )
+    return _validators("|".join(parts), last_modified)
+
+
+def not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _response(body, etag, last_modified):
+    if not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def product_response(query, build, tags):
+    """Conditional, optionally cached JSON response over the products of ``query``.
+
+    A matching ``If-None-Match``/``If-Modified-Since`` gets a 304 before
+    ``build()`` runs. ``build`` returns the payload, or ``None`` when there
+    is nothing to show; then this returns ``None`` and caches nothing.
+    ``tags`` is called only when the response is about to be cached.
+    """
+    key = cache_key()
+    cached = response_cache.get(key) if response_cache.enabled else None
+    if cached is not None:
+        return _response(cached.body, cached.etag, cached.last_modified)
+
+    etag, last_modified = product_validators(query, key)
+    if not_modified(etag, last_modified):
+        return _response(b"", etag, last_modified)
+
+    payload = build()
+    if payload is None:
+        return None
+    return _cache_response(key, payload, etag, last_modified, tags)
+
+
+def page_response(build, tags):
+    """Conditional, optionally cached JSON response for one keyset page.
+
+    ``build`` returns ``(payload, rows)``: the page payload with its
+    ``"next"`` cursor and the page rows with ``id`` and ``updated_at``. The
+    page is read first and the validators come from it, so both 200 and 304
+    cost only the page query rather than an aggregate over every match.
+    """
+    key = cache_key()
+    cached = response_cache.get(key) if response_cache.enabled else None
+    if cached is not None:
+        return _response(cached.body, cached.etag, cached.last_modified)
+
+    payload, rows = build()
+    etag, last_modified = page_validators(key, rows, payload["next"])
+    if not_modified(etag, last_modified):
+        return _response(b"", etag, last_modified)
+    return _cache_response(key, payload, etag, last_modified, tags)
+
+
+def _cache_response(key, payload, etag, last_modified, tags):
+    body = current_app.json.dumps(payload).encode()
+    if response_cache.enabled:
+        response_cache.set(key, body, etag, last_modified, tags())
+    return _response(body, etag, last_modified)
+
+
+def mark_products_changed(session, tags):
+    # Как и кэш прав, сбрасываем только после commit
+    session.info.setdefault("response_cache_invalidations", set()).update(tags)
+
+
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_update")
+@event.listens_for(Product, "after_delete")
+def _product_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    history = inspect(target).attrs.category_id.history
+    category_ids = {target.category_id, *history.deleted}
+    mark_products_changed(
+        session,
+        {product_tag(target.id), *(category_tag(cid) for cid in category_ids)},
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    tags = session.info.pop("response_cache_invalidations", None)
+    if tags:
+        response_cache.invalidate(tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("response_cache_invalidations", None)
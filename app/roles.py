@@ -0,0 +1,109 @@
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.query_counter import query_counter
+from models.user_models import (
+    Group,
+    GroupEnum,
+    Permission,
+    PermissionEnum,
+    PermissionGroup,
+    Role,
+    RoleEnum,
+)
+
+ROLE_GROUPS = {
+    RoleEnum.ADMIN: GroupEnum.ADMIN,
+    RoleEnum.BUYER: GroupEnum.BUYER,
+}
+GROUP_PERMISSIONS = {
+    GroupEnum.ADMIN: [
+        PermissionEnum.CREATE_UPDATE,
+        PermissionEnum.DELETE,
+        PermissionEnum.LIST_VIEW,
+    ],
+    GroupEnum.BUYER: [PermissionEnum.LIST_VIEW],
+}
+
+
+def seed_roles():
+    """Create missing roles, groups, permissions and their links.
+
+    Safe to run repeatedly. Returns ``{RoleEnum: (role_id, group_id)}``.
+    """
+    roles = {role.name: role for role in Role.query.all()}
+    groups = {group.name: group for group in Group.query.all()}
+    permissions = {permission.name: permission for permission in Permission.query.all()}
+
+    for name in RoleEnum:
+        if name not in roles:
+            roles[name] = Role(name=name)
+            db.session.add(roles[name])
+    for name in GroupEnum:
+        if name not in groups:
+            groups[name] = Group(name=name)
+            db.session.add(groups[name])
+    for name in PermissionEnum:
+        if name not in permissions:
+            permissions[name] = Permission(name=name)
+            db.session.add(permissions[name])
+    db.session.flush()
+
+    links = set(
+        db.session.execute(
+            select(PermissionGroup.group_id, PermissionGroup.permission_id)
+        )
+    )
+    for group_name, permission_names in GROUP_PERMISSIONS.items():
+        for permission_name in permission_names:
+            link = (groups[group_name].id, permissions[permission_name].id)
+            if link not in links:
+                db.session.add(PermissionGroup(group_id=link[0], permission_id=link[1]))
+    db.session.commit()
+
+    return {
+        role_name: (roles[role_name].id, groups[group_name].id)
+        for role_name, group_name in ROLE_GROUPS.items()
+    }
+
+
+class RoleRegistry:
+    """Process-level map of ``RoleEnum -> (role_id, group_id)``.
+
+    Filled once per process, so signup does not look up roles, groups or
+    permissions. Deployments seed with ``flask seed-roles``; if that was
+    skipped, the first lookup seeds the missing rows itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = None
+
+    def init_app(self, app):
+        app.extensions["role_registry"] = self
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._ids = None
+
+    def ids(self, role):
+        ids = self._ids
+        if ids is None:
+            with self._lock:
+                if self._ids is None:
+                    with query_counter.paused():
+                        try:
+                            self._ids = seed_roles()
+                        except IntegrityError:
+                            # Другой воркер сидировал одновременно с нами
+                            db.session.rollback()
+                            self._ids = seed_roles()
+                ids = self._ids
+        return ids[role]
+
+
+role_registry = RoleRegistry()
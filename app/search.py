@@ -0,0 +1,117 @@
+import re
+
+from sqlalchemy import DDL, column, event, func, literal_column, or_, select, table
+
+from app.extensions import db
+from app.serializers import PRODUCT_COLUMNS
+from models.product_models import Product
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TOKENS = 8
+
+# Внешний FTS5-индекс поверх products: триггеры держат его в актуальном
+# состоянии при любой записи, включая массовый импорт через Core.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, title, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, title) "
+    "VALUES (new.id, new.name, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, title) "
+    "VALUES ('delete', old.id, old.name, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, title "
+    "ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, title) "
+    "VALUES ('delete', old.id, old.name, old.title); "
+    "INSERT INTO products_fts(rowid, name, title) "
+    "VALUES (new.id, new.name, new.title); END",
+]
+POSTGRESQL_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', "
+    "coalesce(name, '') || ' ' || coalesce(title, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector "
+    "ON products USING GIN (search_vector)",
+]
+
+for statement in SQLITE_DDL:
+    event.listen(
+        Product.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
+for statement in POSTGRESQL_DDL:
+    event.listen(
+        Product.__table__,
+        "after_create",
+        DDL(statement).execute_if(dialect="postgresql"),
+    )
+event.listen(
+    Product.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS products_fts").execute_if(dialect="sqlite"),
+)
+
+products_fts = table("products_fts", column("rowid"), column("rank"))
+search_vector = literal_column("products.search_vector")
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TOKENS]
+
+
+def search_products(query, filters=(), limit=20):
+    """Return products matching every token of ``query`` as a word prefix.
+
+    SQLite uses the FTS5 index ordered by bm25, PostgreSQL the GIN-indexed
+    tsvector ordered by ts_rank. Other backends fall back to unranked LIKE.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = " ".join(f'"{token}"*' for token in tokens)
+        stmt = (
+            select(*PRODUCT_COLUMNS)
+            .select_from(products_fts.join(Product, Product.id == products_fts.c.rowid))
+            .where(literal_column("products_fts").op("MATCH")(match))
+            .order_by(products_fts.c.rank)
+        )
+    elif dialect == "postgresql":
+        tsquery = func.to_tsquery(
+            "simple", " & ".join(f"{token}:*" for token in tokens)
+        )
+        stmt = (
+            select(*PRODUCT_COLUMNS)
+            .where(search_vector.op("@@")(tsquery))
+            .order_by(func.ts_rank(search_vector, tsquery).desc(), Product.id)
+        )
+    else:
+        stmt = select(*PRODUCT_COLUMNS).order_by(Product.id)
+        for token in tokens:
+            pattern = f"%{token}%"
+            stmt = stmt.where(
+                or_(Product.name.ilike(pattern), Product.title.ilike(pattern))
+            )
+
+    for condition in filters:
+        stmt = stmt.where(condition)
+    return db.session.execute(stmt.limit(limit)).all()
+
+
+def rebuild_search_index():
+    """Create missing search structures and reindex all products."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DDL:
+            db.session.execute(db.text(statement))
+        db.session.execute(
+            db.text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        )
+    elif dialect == "postgresql":
+        for statement in POSTGRESQL_DDL:
+            db.session.execute(db.text(statement))
+    db.session.commit()
+    return dialect
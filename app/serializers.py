@@ -0,0 +1,29 @@
+from models.product_models import Category, Product
+from models.user_models import User
+
+# Колонки ответов API: выбираем только их, без загрузки ORM-объектов.
+# Ключи совпадают с to_dict() соответствующих моделей.
+PRODUCT_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.title,
+    Product.price,
+    Product.stock,
+    Product.created_at,
+)
+CATEGORY_COLUMNS = (
+    Category.id,
+    Category.name,
+    Category.parent_id,
+    Category.created_at,
+)
+USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.created_at,
+)
+
+
+def rows_to_dicts(rows):
+    return [row._asdict() for row in rows]
@@ -0,0 +1,83 @@
+"""Production server: gunicorn with N worker processes.
+
+Usage:
+    python -m app.serving [--workers N] [--worker-class gevent|gthread|sync]
+        [--threads 8] [--worker-connections 1000] [--bind 0.0.0.0:8000]
+
+Every worker builds its own app with ``create_app()`` after the fork, so
+engine pools, the password hashing pool and the XLSX writer thread are never
+shared between processes.
+"""
+
+import argparse
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+WORKER_CLASSES = ("gevent", "gthread", "sync")
+
+
+def default_workers():
+    return int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+
+def post_fork(server, worker):
+    # psycopg2 блокирует весь процесс на ожидании базы, пока его не пропатчить
+    # под gevent; без psycogreen (например, на SQLite) патч не нужен
+    if server.cfg.worker_class_str == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            return
+        patch_psycopg()
+
+
+class ShopApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import create_app
+
+        return create_app()
+
+
+def parse_options(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default=os.environ.get("BIND", "0.0.0.0:8000"))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--worker-class", choices=WORKER_CLASSES, default="gevent")
+    parser.add_argument("--threads", type=int, default=8, help="gthread only")
+    parser.add_argument(
+        "--worker-connections", type=int, default=1000, help="gevent only"
+    )
+    parser.add_argument("--timeout", type=int, default=30)
+    parser.add_argument("--max-requests", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": args.worker_class,
+        "threads": args.threads,
+        "worker_connections": args.worker_connections,
+        "timeout": args.timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+
+
+def main(argv=None):
+    ShopApplication(parse_options(argv)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,87 @@
 from decouple import config
 
+# Настройки без значения по умолчанию и имена их переменных окружения
+REQUIRED_ENV = {
+    "SECRET_KEY": "SECRET_KEY",
+    "SQLALCHEMY_DATABASE_URI": "DATABASE_URL",
+    "JWT_SECRET_KEY": "JWT_SECRET_KEY",
+}
+
+
+class DefaultConfig:
+    """Defaults of every optional setting; ``create_app()`` starts from these.
+
+    Each one can be overridden by an environment variable of the same name.
+    """
 
-class Config:
-    SECRET_KEY = config("SECRET_KEY")
-    SQLALCHEMY_DATABASE_URI = config("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    JWT_SECRET_KEY = config("JWT_SECRET_KEY")
+    # Пусто - все запросы идут в основную базу
+    DATABASE_REPLICA_URL = ""
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+    # 0 - без ограничения; поддерживается для PostgreSQL и MySQL
+    DB_STATEMENT_TIMEOUT_MS = 0
+
+    PASSWORD_HASH_METHOD = "scrypt"
+    # 0 - по числу ядер
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_MAX_PENDING = 64
+
+    LOGIN_RATE_LIMIT_PER_EMAIL = 5
+    LOGIN_RATE_LIMIT_PER_IP = 20
+    LOGIN_RATE_LIMIT_WINDOW = 60.0
+    # Пусто - лимиты хранятся в памяти процесса
+    LOGIN_RATE_LIMIT_REDIS_URL = ""
+
+    PERMISSION_CACHE_SIZE = 10000
+    PERMISSION_CACHE_TTL = 300.0
+
+    CATEGORY_CACHE_TTL = 60.0
+    # 0 - кэш ответов с продуктами выключен, остаются только ETag/304
+    RESPONSE_CACHE_MAX_BYTES = 0
+    RESPONSE_CACHE_TTL = 60.0
+
+    # Ответы запросов с Idempotency-Key: срок хранения, блокировка ключа на
+    # время первого запроса, размер кэша процесса и порции очистки
+    IDEMPOTENCY_TTL = 86400
+    IDEMPOTENCY_LOCK_TIMEOUT = 60
+    IDEMPOTENCY_CACHE_SIZE = 10000
+    IDEMPOTENCY_PURGE_EVERY = 100
+    IDEMPOTENCY_PURGE_BATCH = 1000
+
+    # Фоновая очистка мягко удаленных категорий и продуктов
+    PURGE_IN_BACKGROUND = True
+    PURGE_BATCH_SIZE = 500
+    PURGE_BATCH_PAUSE = 0.05
+    PURGE_INTERVAL = 300.0
+
+    # Метрики запросов, /metrics и заголовок Server-Timing
+    METRICS_ENABLED = True
+
+    XLSX_EXPORT_FILE = "xlsx_files/product_list.xlsx"
+    XLSX_EXPORT_BATCH_SIZE = 500
+    XLSX_EXPORT_FLUSH_INTERVAL = 2.0
+
+
+def env_config():
+    """Settings read from the environment and ``.env`` through decouple.
+
+    Called by ``create_app()`` only when no config object is passed, so
+    tests and embedding code never need these variables.
+    """
+    values = {name: config(env_name) for name, env_name in REQUIRED_ENV.items()}
+    for name in dir(DefaultConfig):
+        if name.isupper():
+            default = getattr(DefaultConfig, name)
+            values[name] = config(name, default=default, cast=type(default))
+    return values
+
+
+def __getattr__(name):
+    # Совместимость со старым `from app.settings import Config`
+    if name == "Config":
+        return type("Config", (DefaultConfig,), env_config())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
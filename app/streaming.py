@@ -0,0 +1,35 @@
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_CHUNK_SIZE = 1000
+
+
+def wants_ndjson():
+    if request.args.get("stream", type=int):
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream the rows of ``query`` as NDJSON while they are being fetched.
+
+    ``yield_per`` fetches rows in batches through one server-side cursor, so
+    the first bytes go out after the first batch and memory does not depend
+    on the table size. The whole stream is one SELECT on one connection,
+    held by ``stream_with_context`` until the last row, so every row comes
+    from the same snapshot.
+    """
+
+    def generate():
+        dumps = current_app.json.dumps
+        lines = []
+        for row in query.yield_per(chunk_size):
+            lines.append(dumps(row._asdict()))
+            if len(lines) >= chunk_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,214 @@
+import atexit
+import logging
+import os
+import threading
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+
+from app.metrics import metrics
+from app.native_threads import run_in_native_thread
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки между процессами нет
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+HEADERS = ["Product ID", "Name", "Title", "Price", "Category ID", "Created_at"]
+COLUMN_WIDTHS = {"A": 8, "B": 25, "C": 40, "D": 8, "E": 8, "F": 20}
+
+
+def product_row(product):
+    return (
+        product.id,
+        product.name,
+        product.title,
+        product.price,
+        product.category_id,
+        product.created_at,
+    )
+
+
+@contextmanager
+def file_lock(file_name):
+    """Exclusive ``flock`` on ``<file_name>.lock``, held across processes.
+
+    Every worker process runs its own export thread, so without it two
+    flushes could load the same workbook and the later save would drop the
+    rows of the earlier one.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{file_name}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _new_workbook(openpyxl):
+    from openpyxl.styles import Font
+
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.append(HEADERS)
+    for column, width in COLUMN_WIDTHS.items():
+        worksheet.column_dimensions[column].width = width
+    bold = Font(bold=True)
+    for col_num in range(1, len(HEADERS) + 1):
+        worksheet.cell(row=1, column=col_num).font = bold
+    return workbook
+
+
+def _load_workbook(openpyxl, file_name):
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    if not os.path.exists(file_name):
+        return _new_workbook(openpyxl)
+    try:
+        return openpyxl.load_workbook(file_name)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        # Иначе каждая следующая порция падала бы на том же файле
+        broken = f"{file_name}.broken-{datetime.utcnow():%Y%m%d%H%M%S}"
+        os.replace(file_name, broken)
+        logger.error("Unreadable XLSX export %s (%s) moved to %s", file_name, e, broken)
+        return _new_workbook(openpyxl)
+
+
+def write_rows_to_xlsx(file_name, rows):
+    # openpyxl импортируется при первой записи, а не при старте воркера
+    import openpyxl
+
+    directory = os.path.dirname(file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with file_lock(file_name):
+        workbook = _load_workbook(openpyxl, file_name)
+        worksheet = workbook.active
+        for row in rows:
+            worksheet.append(list(row))
+
+        # Сохраняем рядом и подменяем файл целиком: оборванная запись не
+        # оставит на месте выгрузки половину zip-архива
+        temp_name = f"{file_name}.tmp"
+        workbook.save(temp_name)
+        workbook.close()
+        os.replace(temp_name, file_name)
+
+
+class XlsxExportQueue:
+    """Collects product rows and appends them to the XLSX file in batches.
+
+    Requests only put a row into an in-memory buffer; a daemon thread opens
+    the workbook once per batch, when ``batch_size`` rows are pending or
+    ``flush_interval`` seconds have passed since the first pending row.
+    Rows for the same product id are coalesced, the latest one wins.
+    """
+
+    def __init__(
+        self,
+        file_name="xlsx_files/product_list.xlsx",
+        batch_size=500,
+        flush_interval=2.0,
+    ):
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+        self.last_flush_at = None
+        self.last_flush_rows = 0
+        self.flushed_total = 0
+        self.last_error = None
+
+    def init_app(self, app):
+        self.file_name = app.config.get("XLSX_EXPORT_FILE", self.file_name)
+        self.batch_size = app.config.get("XLSX_EXPORT_BATCH_SIZE", self.batch_size)
+        self.flush_interval = app.config.get(
+            "XLSX_EXPORT_FLUSH_INTERVAL", self.flush_interval
+        )
+        if "xlsx_export" not in app.extensions:
+            atexit.register(self.flush)
+        app.extensions["xlsx_export"] = self
+
+    def enqueue(self, product):
+        row = product_row(product)
+        with self._cond:
+            self._pending[row[0]] = row
+            self._cond.notify()
+        self._ensure_worker()
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def status(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "last_flush_at": (
+                self.last_flush_at.isoformat() if self.last_flush_at else None
+            ),
+            "last_flush_rows": self.last_flush_rows,
+            "flushed_total": self.flushed_total,
+            "last_error": self.last_error,
+        }
+
+    def flush(self):
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            rows = sorted(batch.values(), key=lambda row: row[0])
+            try:
+                with metrics.timer("xlsx_export_write"):
+                    # Под gevent поток очереди - гринлет, а openpyxl держит CPU
+                    run_in_native_thread(write_rows_to_xlsx, self.file_name, rows)
+            except Exception as e:
+                logger.exception("XLSX export of %s rows failed", len(rows))
+                self.last_error = str(e)
+                # Возвращаем строки в очередь, более свежие версии не затираем
+                with self._cond:
+                    for product_id, row in batch.items():
+                        self._pending.setdefault(product_id, row)
+                return 0
+
+            self.last_flush_at = datetime.utcnow()
+            self.last_flush_rows = len(rows)
+            self.flushed_total += len(rows)
+            self.last_error = None
+            return len(rows)
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            # Поток стартует лениво, уже после fork воркера
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="xlsx-export", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+            self.flush()
@@ -0,0 +1,448 @@
+"""Throughput, latency percentiles and queries per request for API routes.
+
+Usage:
+    python -m benchmarks.bench_endpoints [--products 20000] [--users 1000]
+        [--categories 200] [--requests 300] [--modes inprocess,server]
+        [--server werkzeug|gunicorn] [--workers 4] [--concurrency 8]
+        [--database-url URL] [--output benchmarks/results/endpoints.json]
+
+Seeds a database (a temporary SQLite file unless --database-url points to an
+empty one), then drives every route in ROUTES through the WSGI app in the same
+process and through a multi-worker HTTP server started as a subprocess.
+The server is gunicorn when it is installed, otherwise werkzeug forking a
+process per connection, which is much slower and only good for comparing runs
+with each other. Queries per request come from the X-Query-Count header.
+Results are JSON with sorted keys, so a committed results file shows
+regressions as a diff.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+
+WORDS = ["phone", "laptop", "tablet", "camera", "watch", "speaker", "monitor"]
+SEED_CHUNK_SIZE = 10_000
+WARMUP_REQUESTS = 5
+
+
+class SeedInfo:
+    """Ids the routes need to build their URLs."""
+
+    def __init__(self, root_id, leaf_id, product_ids, token):
+        self.root_id = root_id
+        self.leaf_id = leaf_id
+        self.product_ids = product_ids
+        self.token = token
+        self._products = itertools.cycle(product_ids)
+
+    def next_product(self):
+        return next(self._products)
+
+
+# (имя, метод, URL, тело запроса); тело и URL строятся по данным сида
+ROUTES = [
+    ("product-list", "GET", lambda s: "/products/product-list?limit=50", None),
+    (
+        "product-list-category",
+        "GET",
+        lambda s: f"/products/product-list?category_id={s.leaf_id}&limit=50",
+        None,
+    ),
+    ("product", "GET", lambda s: f"/products/product/{s.next_product()}", None),
+    (
+        "category-products",
+        "GET",
+        lambda s: f"/products/category/{s.leaf_id}/products",
+        None,
+    ),
+    (
+        "category-subtree",
+        "GET",
+        lambda s: f"/products/category/{s.root_id}/products?include_descendants=1",
+        None,
+    ),
+    ("categories", "GET", lambda s: "/products/categories", None),
+    ("categories-tree", "GET", lambda s: "/products/categories/tree", None),
+    ("search", "GET", lambda s: "/products/search?q=phone", None),
+    ("all-users", "GET", lambda s: "/users/all-users", None),
+    (
+        "product-create",
+        "POST",
+        lambda s: "/products/product-create",
+        lambda s: {
+            "category_id": s.leaf_id,
+            "name": "Benchmark",
+            "title": "t",
+            "price": 1,
+        },
+    ),
+]
+
+
+def create_benchmark_app():
+    from app import create_app
+
+    app = create_app()
+    app.config["QUERY_COUNT_HEADER"] = True
+    return app
+
+
+def seed(users, categories, products):
+    """Fill an empty database; reuse the data if products already exist."""
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import func, insert, select
+
+    from app.extensions import db
+    from app.passwords import hash_password
+    from app.roles import seed_roles
+    from models.product_models import Category, Product, rebuild_category_paths
+    from models.user_models import RoleEnum, User
+
+    db.create_all()
+    role_ids = seed_roles()
+
+    if not db.session.scalar(select(func.count(Product.id))):
+        # Все пользователи получают один хэш: сид не должен упираться в scrypt
+        password_hash = hash_password("benchmark")
+        admin_role, admin_group = role_ids[RoleEnum.ADMIN]
+        buyer_role, buyer_group = role_ids[RoleEnum.BUYER]
+        db.session.execute(
+            insert(User),
+            [
+                {
+                    "username": f"user{i}",
+                    "email": f"user{i}@bench.local",
+                    "password_hash": password_hash,
+                    "role_id": admin_role if i == 0 else buyer_role,
+                    "group_id": admin_group if i == 0 else buyer_group,
+                }
+                for i in range(max(users, 1))
+            ],
+        )
+
+        # Двухуровневое дерево: корни и листья под ними по кругу
+        roots = max(categories // 20, 1)
+        db.session.execute(
+            insert(Category), [{"name": f"Root {i}"} for i in range(roots)]
+        )
+        root_ids = db.session.scalars(select(Category.id).order_by(Category.id)).all()
+        leaves = max(categories - roots, 1)
+        db.session.execute(
+            insert(Category),
+            [
+                {"name": f"Leaf {i}", "parent_id": root_ids[i % roots]}
+                for i in range(leaves)
+            ],
+        )
+        db.session.commit()
+        rebuild_category_paths()
+
+        leaf_ids = db.session.scalars(
+            select(Category.id).where(Category.parent_id.is_not(None))
+        ).all()
+        for start in range(0, products, SEED_CHUNK_SIZE):
+            db.session.execute(
+                insert(Product),
+                [
+                    {
+                        "name": f"{WORDS[i % len(WORDS)]} {i}",
+                        "title": "benchmark product",
+                        "price": i % 1000,
+                        "category_id": leaf_ids[i % len(leaf_ids)],
+                    }
+                    for i in range(start, min(start + SEED_CHUNK_SIZE, products))
+                ],
+            )
+            db.session.commit()
+
+    leaf_id = db.session.scalar(
+        select(Category.id).where(Category.parent_id.is_not(None)).limit(1)
+    )
+    root_id = db.session.scalar(
+        select(Category.parent_id).where(Category.id == leaf_id)
+    )
+    product_ids = db.session.scalars(select(Product.id).limit(1000)).all()
+    admin_id = db.session.scalar(
+        select(User.id).where(User.role_id == role_ids[RoleEnum.ADMIN][0]).limit(1)
+    )
+    return SeedInfo(root_id, leaf_id, product_ids, create_access_token(admin_id))
+
+
+def percentile(sorted_values, fraction):
+    # Ближайший ранг: без интерполяции, как в большинстве нагрузочных утилит
+    if not sorted_values:
+        return None
+    index = max(int(round(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(latencies, queries, errors, sizes, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries_per_request": (
+            round(sum(queries) / len(queries), 2) if queries else None
+        ),
+        "response_bytes": round(sum(sizes) / len(sizes)) if sizes else 0,
+    }
+
+
+def run_inprocess(app, info, requests):
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {info.token}"}
+    results = {}
+    for name, method, url, body in ROUTES:
+        for _ in range(WARMUP_REQUESTS):
+            client.open(
+                url(info), method=method, json=body and body(info), headers=headers
+            )
+
+        latencies, queries, sizes, errors = [], [], [], 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started = time.perf_counter()
+            response = client.open(
+                url(info), method=method, json=body and body(info), headers=headers
+            )
+            data = response.get_data()
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                errors += 1
+            if "X-Query-Count" in response.headers:
+                queries.append(int(response.headers["X-Query-Count"]))
+            sizes.append(len(data))
+        results[name] = summarize(
+            latencies, queries, errors, sizes, time.perf_counter() - started
+        )
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server, workers, port, env):
+    if server == "gunicorn":
+        if shutil.which("gunicorn") is None:
+            raise SystemExit("gunicorn is not installed")
+        command = [
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--log-level",
+            "warning",
+            "benchmarks.bench_endpoints:create_benchmark_app()",
+        ]
+    else:
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_endpoints",
+            "--serve",
+            str(port),
+            "--workers",
+            str(workers),
+        ]
+    process = subprocess.Popen(command, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{server} exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit(f"{server} did not start on port {port}")
+
+
+def serve(port, workers):
+    from werkzeug.serving import WSGIRequestHandler, run_simple
+
+    class NoDelayHandler(WSGIRequestHandler):
+        def setup(self):
+            super().setup()
+            # Заголовки и тело уходят разными send(): без TCP_NODELAY
+            # алгоритм Нейгла добавляет ~40 мс к каждому ответу
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Отдельный процесс на соединение: ближайший аналог нескольких воркеров
+    # без зависимостей сверх werkzeug
+    run_simple(
+        "127.0.0.1",
+        port,
+        create_benchmark_app(),
+        processes=workers,
+        threaded=False,
+        use_reloader=False,
+        request_handler=NoDelayHandler,
+    )
+
+
+def http_worker(port, method, path, body, headers, count):
+    latencies, queries, sizes, errors = [], [], [], 0
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    payload = json.dumps(body).encode() if body is not None else None
+    for _ in range(count):
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер закрыл keep-alive соединение - открываем новое
+                connection.close()
+                if attempt:
+                    raise
+        latencies.append(time.perf_counter() - started)
+        if response.status >= 400:
+            errors += 1
+        if response.getheader("X-Query-Count") is not None:
+            queries.append(int(response.getheader("X-Query-Count")))
+        sizes.append(len(data))
+        if response.getheader("Connection", "").lower() == "close":
+            connection.close()
+    connection.close()
+    return latencies, queries, sizes, errors
+
+
+def run_server(info, requests, concurrency, port):
+    headers = {
+        "Authorization": f"Bearer {info.token}",
+        "Content-Type": "application/json",
+    }
+    per_worker = max(requests // concurrency, 1)
+    results = {}
+    with ThreadPoolExecutor(concurrency) as pool:
+        for name, method, url, body in ROUTES:
+            http_worker(port, method, url(info), body and body(info), headers, 2)
+
+            started = time.perf_counter()
+            futures = [
+                pool.submit(
+                    http_worker,
+                    port,
+                    method,
+                    url(info),
+                    body and body(info),
+                    headers,
+                    per_worker,
+                )
+                for _ in range(concurrency)
+            ]
+            latencies, queries, sizes, errors = [], [], [], 0
+            for future in futures:
+                worker_latencies, worker_queries, worker_sizes, worker_errors = (
+                    future.result()
+                )
+                latencies += worker_latencies
+                queries += worker_queries
+                sizes += worker_sizes
+                errors += worker_errors
+            results[name] = summarize(
+                latencies, queries, errors, sizes, time.perf_counter() - started
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=300, help="per route")
+    parser.add_argument("--modes", default="inprocess,server")
+    parser.add_argument(
+        "--server",
+        choices=("werkzeug", "gunicorn"),
+        default="gunicorn" if shutil.which("gunicorn") else "werkzeug",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--database-url")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.workers)
+        return
+
+    # Каталог для временной базы и XLSX-выгрузки, чтобы не трогать рабочие файлы
+    tmpdir = tempfile.mkdtemp(prefix="bench-endpoints-")
+    os.environ["XLSX_EXPORT_FILE"] = os.path.join(tmpdir, "product_list.xlsx")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmpdir}/bench.db"
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    results = {
+        "config": {
+            "products": args.products,
+            "users": args.users,
+            "categories": args.categories,
+            "requests_per_route": args.requests,
+            "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+            "python": platform.python_version(),
+        }
+    }
+    try:
+        app = create_benchmark_app()
+        with app.app_context():
+            started = time.perf_counter()
+            info = seed(args.users, args.categories, args.products)
+            results["config"]["seed_seconds"] = round(time.perf_counter() - started, 2)
+
+            if "inprocess" in modes:
+                results["inprocess"] = run_inprocess(app, info, args.requests)
+
+        if "server" in modes:
+            port = free_port()
+            process = start_server(args.server, args.workers, port, dict(os.environ))
+            try:
+                results["server"] = {
+                    "server": args.server,
+                    "workers": args.workers,
+                    "concurrency": args.concurrency,
+                    "routes": run_server(info, args.requests, args.concurrency, port),
+                }
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
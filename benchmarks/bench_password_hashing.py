@@ -0,0 +1,61 @@
+"""Login throughput per core for password hash settings.
+
+Usage:
+    python -m benchmarks.bench_password_hashing [--seconds 2] [METHOD ...]
+
+Each method is timed on a single thread, so the result is logins per second
+per core; multiply by PASSWORD_HASH_WORKERS for a worker's ceiling.
+"""
+
+import argparse
+import json
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHODS = [
+    "scrypt:32768:8:1",
+    "scrypt:16384:8:1",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:100000",
+]
+
+
+def bench_method(method, seconds):
+    password_hash = generate_password_hash("benchmark-password", method=method)
+    count = 0
+    started = time.perf_counter()
+    while True:
+        check_password_hash(password_hash, "benchmark-password")
+        count += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            break
+    return {
+        "method": method,
+        "logins_per_sec_per_core": round(count / elapsed, 2),
+        "ms_per_login": round(elapsed / count * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("methods", nargs="*", default=DEFAULT_METHODS)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    for method in args.methods:
+        result = bench_method(method, args.seconds)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{result['method']:<24} {result['logins_per_sec_per_core']:>10.2f} "
+                f"logins/s/core {result['ms_per_login']:>9.3f} ms/login"
+            )
+
+
+if __name__ == "__main__":
+    main()
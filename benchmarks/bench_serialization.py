@@ -0,0 +1,95 @@
+"""Rows per second for serializing a large product list.
+
+Usage:
+    python -m benchmarks.bench_serialization [--rows 100000] [--repeat 3]
+
+Compares the ORM path (Product.query.all(), to_dict(), Flask's default JSON
+provider) with column rows from PRODUCT_COLUMNS encoded by FastJSONProvider,
+against an in-memory SQLite database.
+"""
+
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.json_provider import FastJSONProvider, orjson  # noqa: E402
+from app.serializers import PRODUCT_COLUMNS, rows_to_dicts  # noqa: E402
+from models.product_models import Product  # noqa: E402
+
+
+def seed(rows):
+    batch = [
+        {"name": f"Product {i}", "title": "benchmark product", "price": i % 1000}
+        for i in range(rows)
+    ]
+    db.session.execute(insert(Product), batch)
+    db.session.commit()
+
+
+def orm_response(app):
+    products = Product.query.all()
+    response = DefaultJSONProvider(app).response(
+        [product.to_dict() for product in products]
+    )
+    db.session.expunge_all()
+    return response
+
+
+def rows_response(app):
+    rows = db.session.query(*PRODUCT_COLUMNS).all()
+    return FastJSONProvider(app).response(rows_to_dicts(rows))
+
+
+def measure(func, app, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = func(app)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "rows_per_sec": round(rows / best, 1),
+        "seconds": round(best, 4),
+        "bytes": len(response.get_data()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+        before = measure(orm_response, app, args.rows, args.repeat)
+        after = measure(rows_response, app, args.rows, args.repeat)
+
+    print(
+        json.dumps(
+            {
+                "rows": args.rows,
+                "orjson": orjson is not None,
+                "before": before,
+                "after": after,
+                "speedup": round(before["seconds"] / after["seconds"], 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
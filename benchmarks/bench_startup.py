@@ -0,0 +1,92 @@
+"""Worker boot time and an import-time breakdown of the app.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5] [--top 15]
+
+Every run is a fresh interpreter that imports ``app``, calls ``create_app()``
+with an explicit config (no environment parsing) and serves one request.
+The median of each phase is reported, plus the modules with the largest
+cumulative import time from ``python -X importtime``.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({
+    "SECRET_KEY": "startup",
+    "JWT_SECRET_KEY": "startup",
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+})
+created = time.perf_counter()
+with app.app_context():
+    from app.extensions import db
+    db.create_all()
+    app.test_client().get("/products/categories")
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (served - created) * 1000,
+    "total_ms": (served - started) * 1000,
+}))
+"""
+
+
+def run_probe():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def import_profile(top):
+    # Строки -X importtime: "import time: self | cumulative | module"
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    modules.sort(key=lambda module: module[2], reverse=True)
+    return [
+        {
+            "module": name,
+            "self_ms": self_us / 1000,
+            "cumulative_ms": cumulative_us / 1000,
+        }
+        for name, self_us, cumulative_us in modules[:top]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    result = {
+        phase: round(statistics.median(run[phase] for run in runs), 1)
+        for phase in runs[0]
+    }
+    result["runs"] = args.runs
+    result["slowest_imports"] = import_profile(args.top)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
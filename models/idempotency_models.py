@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class IdempotencyKey(db.Model):
+    """Stored response of a write request sent with an ``Idempotency-Key``.
+
+    ``status_code`` is empty while the first request is still running.
+    Rows past ``expires_at`` are ignored and purged in batches.
+    """
+
+    __tablename__ = "idempotency_keys"
+    # sha256 от пользователя, метода, пути и самого ключа
+    key = db.Column(db.String(64), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
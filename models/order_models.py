@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class Cart(db.Model):
+    __tablename__ = "carts"
+    id = db.Column(db.Integer, primary_key=True)
+    # У покупателя одна корзина
+    user_id = db.Column(
+        db.Integer, db.ForeignKey("users.id"), unique=True, nullable=False
+    )
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    items = db.relationship("CartItem", backref="cart", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"Cart: <{self.user_id}>"
+
+
+class CartItem(db.Model):
+    __tablename__ = "cart_items"
+    cart_id = db.Column(
+        db.Integer, db.ForeignKey("carts.id", ondelete="CASCADE"), primary_key=True
+    )
+    product_id = db.Column(
+        db.Integer, db.ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    quantity = db.Column(db.Integer, nullable=False)
+
+    def to_dict(self):
+        return {"product_id": self.product_id, "quantity": self.quantity}
+
+
+class Order(db.Model):
+    __tablename__ = "orders"
+    __table_args__ = (db.Index("ix_orders_user_created_at", "user_id", "created_at"),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="placed")
+    total = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    items = db.relationship(
+        "OrderItem",
+        backref="order",
+        cascade="all, delete-orphan",
+        order_by="OrderItem.id",
+    )
+
+    def __repr__(self):
+        return f"Order: <{self.id}>"
+
+    def to_dict(self, items=None):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "created_at": self.created_at.isoformat(),
+            "items": items if items is not None else [i.to_dict() for i in self.items],
+        }
+
+
+class OrderItem(db.Model):
+    __tablename__ = "order_items"
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(
+        db.Integer,
+        db.ForeignKey("orders.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # Пусто, если продукт удален очисткой: позиция хранит цену и количество
+    product_id = db.Column(
+        db.Integer, db.ForeignKey("products.id", ondelete="SET NULL"), nullable=True
+    )
+    quantity = db.Column(db.Integer, nullable=False)
+    # Цена на момент заказа, а не текущая цена продукта
+    price = db.Column(db.Integer, nullable=False)
+
+    def to_dict(self):
+        return {
+            "product_id": self.product_id,
+            "quantity": self.quantity,
+            "price": self.price,
+        }
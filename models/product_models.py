@@ -1,14 +1,59 @@
 from datetime import datetime
 
+from sqlalchemy import (
+    and_,
+    case,
+    delete,
+    event,
+    exists,
+    func,
+    insert,
+    inspect,
+    literal,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.orm import Session, with_loader_criteria
+from sqlalchemy.orm.attributes import set_committed_value
+
 from app.extensions import db
 
+NOT_DELETED = "deleted_at IS NULL"
+DELETED = "deleted_at IS NOT NULL"
+
+
+def partial_index(name, *columns, where=NOT_DELETED, **kwargs):
+    # Частичный индекс: в него попадают только строки, которые видят запросы.
+    # Удаленные строки ждут очистки и индексы списков не раздувают
+    return db.Index(
+        name,
+        *columns,
+        postgresql_where=db.text(where),
+        sqlite_where=db.text(where),
+        **kwargs,
+    )
+
 
 class Category(db.Model):
     __tablename__ = "categories"
+    __table_args__ = (
+        partial_index(
+            "ix_categories_path",
+            "path",
+            postgresql_ops={"path": "varchar_pattern_ops"},
+        ),
+        partial_index("ix_categories_deleted_at", "deleted_at", where=DELETED),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=True)
     parent_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Материализованный путь от корня: "/1/5/12/". Поддерево категории -
+    # все строки, чей path начинается с ее path.
+    path = db.Column(db.String(255), nullable=True)
+    # Время мягкого удаления; строку потом удаляет app.purge
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
     parent = db.relationship("Category", remote_side=[id], backref=("children"))
 
@@ -23,15 +68,90 @@ class Category(db.Model):
             "created_at": self.created_at.isoformat(),
         }
 
+    def subtree_filter(self):
+        return Category.path.like(f"{self.path}%")
+
+
+def build_category_path(parent_path, category_id):
+    return f"{parent_path or '/'}{category_id}/"
+
+
+@event.listens_for(Category, "after_insert")
+def set_category_path(mapper, connection, target):
+    categories = Category.__table__
+    parent_path = None
+    if target.parent_id is not None:
+        parent_path = connection.scalar(
+            select(categories.c.path).where(categories.c.id == target.parent_id)
+        )
+    path = build_category_path(parent_path, target.id)
+    connection.execute(
+        update(categories).where(categories.c.id == target.id).values(path=path)
+    )
+    set_committed_value(target, "path", path)
+
+
+def rebuild_category_paths():
+    """Recompute ``path`` for every category from the ``parent_id`` links."""
+    rows = db.session.execute(select(Category.id, Category.parent_id)).all()
+    children = {}
+    for category_id, parent_id in rows:
+        children.setdefault(parent_id, []).append(category_id)
+
+    paths = {}
+    stack = [(category_id, "/") for category_id in children.get(None, [])]
+    while stack:
+        category_id, parent_path = stack.pop()
+        paths[category_id] = build_category_path(parent_path, category_id)
+        stack.extend(
+            (child_id, paths[category_id]) for child_id in children.get(category_id, [])
+        )
+
+    if paths:
+        db.session.execute(
+            update(Category),
+            [{"id": category_id, "path": path} for category_id, path in paths.items()],
+        )
+    db.session.commit()
+    return len(paths)
+
 
 class Product(db.Model):
     __tablename__ = "products"
+    __table_args__ = (
+        # Индексы под keyset-пагинацию /product-list: (ключ сортировки, id)
+        partial_index("ix_products_created_at_id", "created_at", "id"),
+        partial_index("ix_products_price_id", "price", "id"),
+        partial_index(
+            "ix_products_category_created_at_id", "category_id", "created_at", "id"
+        ),
+        partial_index("ix_products_category_price_id", "category_id", "price", "id"),
+        partial_index(
+            "ix_products_name",
+            "name",
+            postgresql_ops={"name": "varchar_pattern_ops"},
+        ),
+        partial_index("ix_products_deleted_at", "deleted_at", where=DELETED),
+        db.CheckConstraint("stock >= 0", name="ck_products_stock_non_negative"),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    category_id = db.Column(db.Integer, db.ForeignKey("categories.id"))
+    # active_history: старые значения цены и категории нужны событиям,
+    # которые ведут историю цен и category_stats, даже после expire
+    category_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey("categories.id")), active_history=True
+    )
     category = db.relationship("Category", backref="products")
     name = db.Column(db.String(150), nullable=False)
     title = db.Column(db.String(150), nullable=False)
-    price = db.Column(db.Integer, nullable=False)
+    price = db.column_property(
+        db.Column(db.Integer, nullable=False), active_history=True
+    )
+    # Остаток на складе; списывается только условным UPDATE при оформлении
+    # заказа (см. app.orders.place_order)
+    stock = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    deleted_at = db.column_property(
+        db.Column(db.DateTime, nullable=True), active_history=True
+    )
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -46,5 +166,296 @@ class Product(db.Model):
             "name": self.name,
             "title": self.title,
             "price": self.price,
+            "stock": self.stock,
             "created_at": self.created_at.isoformat(),
         }
+
+
+# Таблица без ORM-сущности: критерий скрытия категорий на нее не действует
+_deleted_categories = Category.__table__.alias("deleted_categories")
+
+
+def product_is_live(product):
+    """Product not deleted itself and not in a deleted category.
+
+    Products of a deleted subtree disappear as soon as the categories are
+    marked, long before the purge removes them. The category check is a
+    primary key lookup.
+    """
+    return and_(
+        product.deleted_at.is_(None),
+        or_(
+            product.category_id.is_(None),
+            ~exists().where(
+                _deleted_categories.c.id == product.category_id,
+                _deleted_categories.c.deleted_at.is_not(None),
+            ),
+        ),
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def hide_deleted(execute_state):
+    # Удаленные категории и продукты не видны ни одному ORM-запросу; очистке
+    # и отчетам, которым они нужны, - execution_options(include_deleted=True)
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(
+                Category, lambda cls: cls.deleted_at.is_(None), include_aliases=True
+            ),
+            with_loader_criteria(
+                Product, lambda cls: product_is_live(cls), include_aliases=True
+            ),
+        )
+
+
+class ProductPriceHistory(db.Model):
+    __tablename__ = "product_price_history"
+    __table_args__ = (
+        db.Index(
+            "ix_product_price_history_product_changed", "product_id", "changed_at"
+        ),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+    )
+    price = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {"price": self.price, "changed_at": self.changed_at.isoformat()}
+
+
+class CategoryStats(db.Model):
+    """Product count and price aggregates of a category, kept up to date on write.
+
+    Only the category's own products are counted, not its subcategories.
+    """
+
+    __tablename__ = "category_stats"
+    category_id = db.Column(
+        db.Integer, db.ForeignKey("categories.id"), primary_key=True
+    )
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    price_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    min_price = db.Column(db.Integer, nullable=True)
+    max_price = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def to_dict(self):
+        return {
+            "category_id": self.category_id,
+            "product_count": self.product_count,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "avg_price": (
+                round(self.price_sum / self.product_count, 2)
+                if self.product_count
+                else None
+            ),
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+def _category_price(aggregate, category_id):
+    products = Product.__table__
+    return (
+        select(aggregate(products.c.price))
+        .where(products.c.category_id == category_id, products.c.deleted_at.is_(None))
+        .scalar_subquery()
+    )
+
+
+def apply_category_stats(connection, category_id, count, price_sum, low, high):
+    """Add ``count`` products (negative to remove) to the stats of a category.
+
+    ``low``/``high`` are the smallest and largest price added or removed.
+    Added prices only widen min/max; when a removed price was the current
+    extreme, min/max are re-read from the (category_id, price) index.
+    """
+    stats = CategoryStats.__table__
+    if count > 0:
+        min_price = case(
+            (or_(stats.c.min_price.is_(None), stats.c.min_price > low), low),
+            else_=stats.c.min_price,
+        )
+        max_price = case(
+            (or_(stats.c.max_price.is_(None), stats.c.max_price < high), high),
+            else_=stats.c.max_price,
+        )
+    else:
+        min_price = case(
+            (stats.c.min_price >= low, _category_price(func.min, category_id)),
+            else_=stats.c.min_price,
+        )
+        max_price = case(
+            (stats.c.max_price <= high, _category_price(func.max, category_id)),
+            else_=stats.c.max_price,
+        )
+
+    result = connection.execute(
+        update(stats)
+        .where(stats.c.category_id == category_id)
+        .values(
+            product_count=stats.c.product_count + count,
+            price_sum=stats.c.price_sum + price_sum,
+            min_price=min_price,
+            max_price=max_price,
+            updated_at=datetime.utcnow(),
+        )
+    )
+    if result.rowcount == 0:
+        # Категория создана до появления category_stats: считаем с нуля
+        connection.execute(insert(stats).from_select(*_stats_select(category_id)))
+
+
+def _stats_select(category_id=None):
+    products = Product.__table__
+    categories = Category.__table__
+    query = (
+        select(
+            categories.c.id,
+            func.count(products.c.id),
+            func.coalesce(func.sum(products.c.price), 0),
+            func.min(products.c.price),
+            func.max(products.c.price),
+            literal(datetime.utcnow(), db.DateTime),
+        )
+        .select_from(
+            categories.outerjoin(
+                products,
+                and_(
+                    products.c.category_id == categories.c.id,
+                    products.c.deleted_at.is_(None),
+                ),
+            )
+        )
+        .group_by(categories.c.id)
+    )
+    if category_id is not None:
+        query = query.where(categories.c.id == category_id)
+    columns = [
+        "category_id",
+        "product_count",
+        "price_sum",
+        "min_price",
+        "max_price",
+        "updated_at",
+    ]
+    return columns, query
+
+
+def record_price(connection, product_id, price):
+    connection.execute(
+        insert(ProductPriceHistory.__table__).values(
+            product_id=product_id, price=price, changed_at=datetime.utcnow()
+        )
+    )
+
+
+def record_bulk_insert(connection, rows):
+    """History and stats for ``(id, category_id, price)`` rows of a Core insert."""
+    if not rows:
+        return
+    now = datetime.utcnow()
+    connection.execute(
+        insert(ProductPriceHistory.__table__),
+        [
+            {"product_id": product_id, "price": price, "changed_at": now}
+            for product_id, _, price in rows
+        ],
+    )
+    by_category = {}
+    for _, category_id, price in rows:
+        if category_id is not None:
+            by_category.setdefault(category_id, []).append(price)
+    for category_id, prices in by_category.items():
+        apply_category_stats(
+            connection, category_id, len(prices), sum(prices), min(prices), max(prices)
+        )
+
+
+@event.listens_for(Category, "after_insert")
+def create_category_stats(mapper, connection, target):
+    connection.execute(
+        insert(CategoryStats.__table__).values(
+            category_id=target.id, product_count=0, price_sum=0
+        )
+    )
+
+
+@event.listens_for(Category, "before_delete")
+def delete_category_stats(mapper, connection, target):
+    stats = CategoryStats.__table__
+    connection.execute(delete(stats).where(stats.c.category_id == target.id))
+
+
+@event.listens_for(Product, "after_insert")
+def product_inserted(mapper, connection, target):
+    record_price(connection, target.id, target.price)
+    if target.category_id is not None:
+        apply_category_stats(
+            connection, target.category_id, 1, target.price, target.price, target.price
+        )
+
+
+@event.listens_for(Product, "after_update")
+def product_updated(mapper, connection, target):
+    state = inspect(target)
+    price = state.attrs.price.history
+    category = state.attrs.category_id.history
+    deleted = state.attrs.deleted_at.history
+    if not (price.has_changes() or category.has_changes() or deleted.has_changes()):
+        return
+
+    old_price = price.deleted[0] if price.deleted else target.price
+    old_category = category.deleted[0] if category.deleted else target.category_id
+    old_deleted_at = deleted.deleted[0] if deleted.deleted else target.deleted_at
+    if price.has_changes() and old_price != target.price:
+        record_price(connection, target.id, target.price)
+    # Мягко удаленный продукт в сводке категории не учитывается
+    if old_category is not None and old_deleted_at is None:
+        apply_category_stats(
+            connection, old_category, -1, -old_price, old_price, old_price
+        )
+    if target.category_id is not None and target.deleted_at is None:
+        apply_category_stats(
+            connection, target.category_id, 1, target.price, target.price, target.price
+        )
+
+
+@event.listens_for(Product, "before_delete")
+def delete_price_history(mapper, connection, target):
+    # SQLite не проверяет внешние ключи, поэтому не полагаемся на ON DELETE CASCADE
+    history = ProductPriceHistory.__table__
+    connection.execute(delete(history).where(history.c.product_id == target.id))
+
+
+@event.listens_for(Product, "after_delete")
+def product_deleted(mapper, connection, target):
+    # Мягко удаленный продукт уже вычтен из сводки
+    if target.category_id is not None and target.deleted_at is None:
+        apply_category_stats(
+            connection,
+            target.category_id,
+            -1,
+            -target.price,
+            target.price,
+            target.price,
+        )
+
+
+def rebuild_category_stats():
+    """Recompute ``category_stats`` for every category from ``products``."""
+    db.session.execute(delete(CategoryStats.__table__))
+    db.session.execute(insert(CategoryStats.__table__).from_select(*_stats_select()))
+    db.session.commit()
+    return db.session.scalar(select(func.count()).select_from(CategoryStats))
@@ -1,9 +1,10 @@
 from datetime import datetime
 from enum import Enum
 
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash
 
 from app.extensions import db
+from app.passwords import hash_password
 
 
 class RoleEnum(Enum):
@@ -76,7 +77,7 @@ class User(db.Model):
         return f"User: <{self.username}>"
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -0,0 +1,133 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from app.extensions import db
+from app.idempotency import idempotent
+from app.orders import (
+    OutOfStock,
+    cart_quantities,
+    clear_cart,
+    parse_items,
+    place_order,
+)
+from app.query_counter import query_budget
+
+from models.order_models import Cart, CartItem, Order
+from models.product_models import Product
+
+order_blueprint = Blueprint("orders", __name__)
+
+
+def _cart_payload(quantities):
+    return {
+        "items": [
+            {"product_id": product_id, "quantity": quantity}
+            for product_id, quantity in sorted(quantities.items())
+        ]
+    }
+
+
+@order_blueprint.route("/cart", methods=["GET"])
+@query_budget(1)
+@jwt_required()
+def get_cart():
+    return jsonify(_cart_payload(cart_quantities(get_jwt_identity()))), 200
+
+
+@order_blueprint.route("/cart/items/<int:product_id>", methods=["PUT"])
+@query_budget(5)
+@jwt_required()
+def set_cart_item(product_id):
+    data = request.get_json(silent=True)
+    quantity = data.get("quantity") if isinstance(data, dict) else None
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+        return jsonify({"error": "Invalid data"}), 400
+
+    if db.session.get(Product, product_id) is None:
+        return jsonify({"error": "Product not found"}), 404
+
+    user_id = get_jwt_identity()
+    cart = db.session.scalar(select(Cart).where(Cart.user_id == user_id))
+    if cart is None:
+        cart = Cart(user_id=user_id)
+        db.session.add(cart)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Корзину успел создать параллельный запрос того же покупателя
+            db.session.rollback()
+            cart = db.session.scalar(select(Cart).where(Cart.user_id == user_id))
+
+    item = db.session.get(CartItem, (cart.id, product_id))
+    if quantity == 0:
+        if item is not None:
+            db.session.delete(item)
+    elif item is None:
+        db.session.add(
+            CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity)
+        )
+    else:
+        item.quantity = quantity
+    db.session.commit()
+
+    return jsonify({"product_id": product_id, "quantity": quantity}), 200
+
+
+@order_blueprint.route("/checkout", methods=["POST"])
+@query_budget(7)
+@jwt_required()
+@idempotent
+def checkout():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    from_cart = "items" not in data
+    if from_cart:
+        quantities = cart_quantities(user_id)
+        if not quantities:
+            return jsonify({"error": "Cart is empty"}), 400
+    else:
+        quantities = parse_items(data["items"])
+        if quantities is None:
+            return jsonify({"error": "Invalid data"}), 400
+
+    try:
+        order, items = place_order(user_id, quantities)
+        if from_cart:
+            clear_cart(user_id)
+        # Сериализуем до commit, чтобы не перечитывать заказ после expire
+        payload = order.to_dict(items)
+        db.session.commit()
+    except OutOfStock as e:
+        db.session.rollback()
+        existing = set(
+            db.session.scalars(select(Product.id).where(Product.id.in_(e.product_ids)))
+        )
+        missing = [
+            product_id for product_id in e.product_ids if product_id not in existing
+        ]
+        if missing:
+            return jsonify({"error": "Product not found", "product_ids": missing}), 404
+        return (
+            jsonify({"error": "Insufficient stock", "product_ids": e.product_ids}),
+            409,
+        )
+
+    return jsonify({"Message": "Order placed successfully", "order": payload}), 201
+
+
+@order_blueprint.route("/<int:order_id>", methods=["GET"])
+@query_budget(2)
+@jwt_required()
+def get_order(order_id):
+    order = db.session.scalar(
+        select(Order)
+        .options(selectinload(Order.items))
+        .where(Order.id == order_id, Order.user_id == get_jwt_identity())
+    )
+    if order is None:
+        return jsonify({"error": "Order not found"}), 404
+    return jsonify(order.to_dict()), 200
@@ -1,21 +1,64 @@
 from datetime import datetime
 
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context
+from sqlalchemy import or_, select, update
+
+from app.batch import InvalidIds, batch_payload
+from app.catalog_export import csv_chunks, iter_product_rows, ndjson_chunks, xlsx_file
+from app.catalog_import import (
+    INT_MAX,
+    INT_MIN,
+    InvalidImportFile,
+    detect_format,
+    import_products,
+    read_rows,
+)
+from app.extensions import category_cache, db, xlsx_export
+from app.idempotency import idempotent
+from app.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    InvalidCursor,
+    keyset_order,
+    keyset_page,
+)
+from app.permissions import require_permission
+from app.purge import purge_worker
+from app.query_counter import UNLIMITED, query_budget
+from app.response_cache import (
+    ALL_PRODUCTS,
+    category_tag,
+    page_response,
+    product_response,
+    product_tag,
+    response_cache,
+)
+from app.search import search_products
+from app.serializers import PRODUCT_COLUMNS, rows_to_dicts
+from app.streaming import ndjson_response, wants_ndjson
+from models.user_models import PermissionEnum
+
+from models.product_models import (
+    Category,
+    CategoryStats,
+    Product,
+    ProductPriceHistory,
+)
 
-import openpyxl
-from openpyxl.styles import Font
-import os
-
-from app.extensions import db
-from models.user_models import RoleEnum, User
+product_blueprint = Blueprint("products", __name__)
 
-from models.product_models import Category, Product
 
-product_blueprint = Blueprint("products", __name__)
+def _valid_int(value, minimum=INT_MIN):
+    # Те же границы 32-битных колонок Integer, что и при импорте
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and minimum <= value <= INT_MAX
+    )
 
 
 @product_blueprint.route("/categories", methods=["POST"])
+@idempotent
 def create_cat():
     data = request.get_json()
 
@@ -34,6 +77,9 @@ def create_cat():
     category = Category(name=data["name"], parent_id=parent_id)
     db.session.add(category)
     db.session.commit()
+    category_cache.invalidate()
+    # Новая подкатегория меняет поддеревья, по которым закэшированы ответы
+    response_cache.invalidate()
 
     return (
         jsonify(
@@ -44,46 +90,78 @@ def create_cat():
 
 
 @product_blueprint.route("/categories", methods=["GET"])
+@query_budget(1)
 def get_cat():
     parent_id = request.args.get("parent_id", type=int)
 
-    if parent_id is not None:
-        cats = Category.query.filter_by(parent_id=parent_id).all()
-    else:
-        cats = Category.query.all()
-    return ([cat.to_dict() for cat in cats]), 200
+    return category_cache.response(
+        ("list", parent_id), lambda: category_cache.categories(parent_id)
+    )
+
+
+@product_blueprint.route("/categories/tree", methods=["GET"])
+@query_budget(1)
+def get_cat_tree():
+    root_id = request.args.get("root_id", type=int)
+
+    if root_id is not None and category_cache.get(root_id) is None:
+        return jsonify({"error": "Category not found"}), 404
+
+    return category_cache.response(
+        ("tree", root_id), lambda: category_cache.tree(root_id)
+    )
 
 
 @product_blueprint.route("/categories/<int:cat_id>", methods=["DELETE"])
+@query_budget(3)
+@require_permission(PermissionEnum.DELETE)
 def delete_cat(cat_id):
-    cat = Category.query.get(cat_id)
+    cat = db.session.get(Category, cat_id)
 
-    if cat is None:
+    # get() может вернуть объект из identity map, не спрашивая базу
+    if cat is None or cat.deleted_at is not None:
         return jsonify({"error": "Category not found"}), 404
 
-    if cat.children:
-        return (
-            jsonify(
-                {
-                    "error": "Category has child categories. Please remove child categories first"
-                }
-            ),
-            400,
+    # Помечаем все поддерево одним UPDATE; сами строки вместе с продуктами
+    # удаляет фоновая очистка небольшими порциями
+    db.session.execute(
+        update(Category)
+        .where(
+            or_(Category.id == cat.id, cat.subtree_filter()),
+            Category.deleted_at.is_(None),
         )
-
-    db.session.delete(cat)
+        .values(deleted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
     db.session.commit()
+    category_cache.invalidate()
+    response_cache.invalidate()
+    purge_worker.wake()
     return jsonify({"Message": "Category deleted successfully"}), 200
 
 
+@product_blueprint.route("/categories/<int:cat_id>/stats", methods=["GET"])
+@query_budget(2)
+def get_cat_stats(cat_id):
+    # Через join со скрытием удаленных: у удаленной категории сводки нет
+    stats = db.session.scalar(
+        select(CategoryStats)
+        .join(Category, Category.id == CategoryStats.category_id)
+        .where(CategoryStats.category_id == cat_id)
+    )
+    if stats is None:
+        if db.session.get(Category, cat_id) is None:
+            return jsonify({"error": "Category not found"}), 404
+        # Категория есть, а сводки нет: база не пересчитана после обновления
+        return jsonify({"error": "Category stats not built"}), 404
+    return jsonify(stats.to_dict()), 200
+
+
 @product_blueprint.route("/product-create", methods=["POST"])
-@jwt_required()
+@query_budget(7)
+@require_permission(PermissionEnum.CREATE_UPDATE)
+@idempotent
 def create_product():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-
-    if not user or user.role.name != RoleEnum.ADMIN:
-        return jsonify({"error": "Access denied. Only admins can create products."})
     data = request.get_json()
 
     if not data or not all(
@@ -100,16 +178,24 @@ def create_product():
     else:
         category = None
 
+    if not _valid_int(data["price"]):
+        return jsonify({"error": "Invalid price"}), 400
+
+    stock = data.get("stock", 0)
+    if not _valid_int(stock, 0):
+        return jsonify({"error": "Invalid stock"}), 400
+
     product = Product(
         name=data["name"],
         title=data["title"],
         price=data["price"],
+        stock=stock,
         category_id=category.id if category else None,
     )
     db.session.add(product)
     db.session.commit()
 
-    write_product_to_xlsx(product)
+    xlsx_export.enqueue(product)
 
     return (
         jsonify(
@@ -118,65 +204,276 @@ def create_product():
         201,
     )
 
-def write_product_to_xlsx(product):
-    file_name = "xlsx_files/product_list.xlsx"
 
-    headers = ["Product ID", "Name", "Title", "Price", "Category ID", "Created_at"]
+@product_blueprint.route("/import", methods=["POST"])
+@query_budget(UNLIMITED)
+@require_permission(PermissionEnum.CREATE_UPDATE)
+def import_products_file():
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": "Invalid data"}), 400
+
+    file_format = detect_format(upload.filename, request.args.get("format"))
+    if file_format is None:
+        return jsonify({"error": "Invalid format"}), 400
+
+    try:
+        report = import_products(read_rows(file_format, upload.stream))
+    except InvalidImportFile:
+        db.session.rollback()
+        return jsonify({"error": "Invalid file"}), 400
+
+    return jsonify(report), 200
+
+
+@product_blueprint.route("/export-status", methods=["GET"])
+def export_status():
+    return jsonify(xlsx_export.status()), 200
+
+
+@product_blueprint.route("/export", methods=["GET"])
+def export_products():
+    export_format = request.args.get("format", "csv")
+
+    if export_format == "xlsx":
+        return send_file(
+            xlsx_file(iter_product_rows()),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            as_attachment=True,
+            download_name="products.xlsx",
+        )
 
-    if os.path.exists(file_name):
-        workbook = openpyxl.load_workbook(file_name)
-        worksheet = workbook.active
+    if export_format == "csv":
+        chunks, mimetype = csv_chunks(iter_product_rows()), "text/csv"
+    elif export_format == "ndjson":
+        chunks, mimetype = ndjson_chunks(iter_product_rows()), "application/x-ndjson"
     else:
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-
-        worksheet.append(headers)
-
-    worksheet.column_dimensions['A'].width = 8  # Product ID
-    worksheet.column_dimensions['B'].width = 25  # Name
-    worksheet.column_dimensions['C'].width = 40  # Title
-    worksheet.column_dimensions['D'].width = 8  # Price
-    worksheet.column_dimensions['E'].width = 8  # Category ID
-    worksheet.column_dimensions['F'].width = 20  # Created_at
-    font_size = Font(bold=True)
-    for col_num in range(1, len(headers) + 1):
-        cell = worksheet.cell(row=1, column=col_num)
-        cell.font = font_size
-
-    if isinstance(product.created_at, str):
-        product.created_at = datetime.strptime(product.created_at, "%Y-%m-%d %H:%M")
-
-    worksheet.append([
-            product.id,
-            product.name,
-            product.title,
-            product.price,
-            product.category_id,
-            product.created_at
-        ])
-
-    workbook.save(file_name)
-    workbook.close()
+        return jsonify({"error": "Invalid format"}), 400
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=products.{export_format}"
+        },
+    )
+
+
+PRODUCT_SORT_COLUMNS = {
+    "created_at": Product.created_at,
+    "price": Product.price,
+}
 
 
 @product_blueprint.route("/product-list", methods=["GET"])
+@query_budget(1)
 def product_list():
-    products = Product.query.all()
-    return ([product.to_dict() for product in products]), 200
+    sort = request.args.get("sort", "created_at")
+    order = request.args.get("order", "asc")
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+
+    if sort not in PRODUCT_SORT_COLUMNS or order not in ("asc", "desc"):
+        return jsonify({"error": "Invalid sort"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit"}), 400
+    limit = min(limit, MAX_LIMIT)
+
+    query = db.session.query(*PRODUCT_COLUMNS)
+
+    category_id = request.args.get("category_id", type=int)
+    if category_id is not None:
+        query = query.filter(Product.category_id == category_id)
+
+    min_price = request.args.get("min_price", type=int)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+
+    max_price = request.args.get("max_price", type=int)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+
+    name_prefix = request.args.get("name")
+    if name_prefix:
+        escaped = (
+            name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        query = query.filter(Product.name.like(f"{escaped}%", escape="\\"))
+
+    if wants_ndjson():
+        # Поток отдает весь отфильтрованный набор; cursor позволяет продолжить
+        try:
+            query = keyset_order(
+                query,
+                PRODUCT_SORT_COLUMNS[sort],
+                Product.id,
+                sort,
+                order,
+                cursor=request.args.get("cursor"),
+            )
+        except InvalidCursor:
+            return jsonify({"error": "Invalid cursor"}), 400
+        return ndjson_response(query)
+
+    def build():
+        # updated_at нужен только для ETag страницы, в ответ он не попадает
+        rows, next_cursor = keyset_page(
+            query.add_columns(Product.updated_at),
+            PRODUCT_SORT_COLUMNS[sort],
+            Product.id,
+            sort,
+            order,
+            limit,
+            cursor=request.args.get("cursor"),
+        )
+        products = rows_to_dicts(rows)
+        for product in products:
+            del product["updated_at"]
+        return {"products": products, "next": next_cursor}, rows
+
+    def tags():
+        if category_id is None:
+            return {ALL_PRODUCTS}
+        return {category_tag(category_id)}
+
+    try:
+        return page_response(build, tags)
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+
+@product_blueprint.route("/product/<int:product_id>", methods=["GET"])
+@query_budget(2)
+def get_product(product_id):
+    query = db.session.query(*PRODUCT_COLUMNS, Product.category_id).filter(
+        Product.id == product_id
+    )
+
+    def build():
+        product = query.first()
+        return product._asdict() if product else None
+
+    def tags():
+        return {product_tag(product_id)}
+
+    response = product_response(query, build, tags)
+    if response is None:
+        return jsonify({"error": "Product not found"}), 404
+    return response
+
+
+@product_blueprint.route("/batch", methods=["GET"])
+@query_budget(1)
+def get_products_batch():
+    try:
+        payload = batch_payload("products", (*PRODUCT_COLUMNS, Product.category_id))
+    except InvalidIds:
+        return jsonify({"error": "Invalid ids"}), 400
+    return jsonify(payload), 200
+
+
+@product_blueprint.route("/product/<int:product_id>", methods=["DELETE"])
+@query_budget(5)
+@require_permission(PermissionEnum.DELETE)
+def delete_product(product_id):
+    product = db.session.get(Product, product_id)
+    if product is None or product.deleted_at is not None:
+        return jsonify({"error": "Product not found"}), 404
+
+    product.deleted_at = datetime.utcnow()
+    db.session.commit()
+    purge_worker.wake()
+    return jsonify({"Message": "Product deleted successfully"}), 200
+
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+@product_blueprint.route("/search", methods=["GET"])
+@query_budget(2)
+def search():
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Invalid query"}), 400
+
+    limit = request.args.get("limit", SEARCH_DEFAULT_LIMIT, type=int)
+    if limit < 1:
+        return jsonify({"error": "Invalid limit"}), 400
+    limit = min(limit, SEARCH_MAX_LIMIT)
+
+    filters = []
+    category_id = request.args.get("category_id", type=int)
+    if category_id is not None:
+        if request.args.get("include_descendants", type=int):
+            category = Category.query.get(category_id)
+            if not category:
+                return jsonify({"error": "Category not found"}), 404
+            subtree = select(Category.id).where(category.subtree_filter())
+            filters.append(Product.category_id.in_(subtree))
+        else:
+            filters.append(Product.category_id == category_id)
+
+    min_price = request.args.get("min_price", type=int)
+    if min_price is not None:
+        filters.append(Product.price >= min_price)
+
+    max_price = request.args.get("max_price", type=int)
+    if max_price is not None:
+        filters.append(Product.price <= max_price)
+
+    products = search_products(query, filters, limit)
+    return jsonify({"products": rows_to_dicts(products)}), 200
+
+
+@product_blueprint.route("/product/<int:product_id>/price-history", methods=["GET"])
+@query_budget(1)
+def get_product_price_history(product_id):
+    history = (
+        ProductPriceHistory.query.filter_by(product_id=product_id)
+        .order_by(ProductPriceHistory.changed_at, ProductPriceHistory.id)
+        .all()
+    )
+    if not history:
+        return jsonify({"error": "Product not found"}), 404
+    return (
+        jsonify(
+            {"product_id": product_id, "history": [row.to_dict() for row in history]}
+        ),
+        200,
+    )
 
 
 @product_blueprint.route("/category/<int:category_id>/products", methods=["GET"])
+@query_budget(4)
 def get_products_by_category(category_id):
     category = Category.query.get(category_id)
 
     if not category:
         return jsonify({"error": "Category not found"}), 404
 
-    products = Product.query.filter_by(category_id=category_id).all()
-
-    if not products:
+    query = db.session.query(*PRODUCT_COLUMNS)
+    include_descendants = request.args.get("include_descendants", type=int)
+    if include_descendants:
+        query = query.join(Category, Product.category_id == Category.id).filter(
+            category.subtree_filter()
+        )
+    else:
+        query = query.filter(Product.category_id == category_id)
+
+    def build():
+        products = query.all()
+        if not products:
+            return None
+        return {"category": category.name, "products": rows_to_dicts(products)}
+
+    def tags():
+        if include_descendants:
+            return {
+                category_tag(cid) for cid in category_cache.subtree_ids(category_id)
+            }
+        return {category_tag(category_id)}
+
+    response = product_response(query, build, tags)
+    if response is None:
         return jsonify({"error": "No products found in this category"}), 404
-
-    products_list = [product.to_dict() for product in products]
-
-    return jsonify({"category": category.name, "products": products_list}), 200
+    return response
@@ -1,185 +1,125 @@
+import math
 from datetime import timedelta
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import create_access_token
+from sqlalchemy.exc import IntegrityError
 
+from app.batch import InvalidIds, batch_payload
 from app.extensions import db
-
-from models.user_models import (
-    Group,
-    GroupEnum,
-    Permission,
-    PermissionEnum,
-    PermissionGroup,
-    Role,
-    RoleEnum,
-    User,
+from app.passwords import (
+    HasherBusy,
+    current_hash_method,
+    needs_rehash,
+    password_hasher,
 )
+from app.query_counter import query_budget
+from app.rate_limit import login_rate_limiter
+from app.roles import role_registry
+from app.serializers import USER_COLUMNS, rows_to_dicts
+from app.streaming import ndjson_response, wants_ndjson
+
+from models.user_models import RoleEnum, User
 
 user_blueprint = Blueprint("users", __name__)
 
 
-@user_blueprint.route("/admin-create", methods=["POST"])
-def create_admin():
+def create_user(role):
     data = request.get_json()
     if not data or not all(k in data for k in ["username", "email", "password"]):
         return jsonify({"error": "Invalid data"}), 400
 
-    if (
-        User.query.filter_by(username=data["username"]).first()
-        or User.query.filter_by(email=data["email"]).first()
-    ):
-        return jsonify({"message": "This username or email already exists"}), 400
-
-    user = User(username=data["username"], email=data["email"])
+    role_id, group_id = role_registry.ids(role)
+    user = User(
+        username=data["username"],
+        email=data["email"],
+        role_id=role_id,
+        group_id=group_id,
+    )
     user.set_password(data["password"])
+    db.session.add(user)
 
+    # Дубликаты ловим по уникальным индексам, без предварительных SELECT
     try:
-        # Отключаем автофлеш для избежания ошибки
-        with db.session.no_autoflush:
-            # Получаем роль администратора
-            admin_role = Role.query.filter_by(name=RoleEnum.ADMIN).first()
-            if not admin_role:
-                admin_role = Role(name=RoleEnum.ADMIN)
-                db.session.add(admin_role)
-
-            # Получаем группу администратора
-            admin_group = Group.query.filter_by(name=GroupEnum.ADMIN).first()
-            if not admin_group:
-                admin_group = Group(name=GroupEnum.ADMIN)
-                db.session.add(admin_group)
-
-            db.session.flush()
-
-            # Назначаем роль и группу пользователю
-            user.role = admin_role
-            user.group = admin_group
-
-            db.session.add(user)
-
-            permissions = [
-                Permission(name=PermissionEnum.CREATE_UPDATE),
-                Permission(name=PermissionEnum.DELETE),
-                Permission(name=PermissionEnum.LIST_VIEW),
-            ]
-
-            for perm in permissions:
-                existing_perm = Permission.query.filter_by(name=perm.name).first()
-                if not existing_perm:
-                    db.session.add(perm)
-                else:
-                    permissions[permissions.index(perm)] = existing_perm
-
         db.session.flush()
-
-        # Сохраняем связи разрешений и групп
-        for perm in permissions:
-            if not PermissionGroup.query.filter_by(
-                group_id=admin_group.id, permission_id=perm.id
-            ).first():
-                group_perm = PermissionGroup(
-                    group_id=admin_group.id, permission_id=perm.id
-                )
-                db.session.add(group_perm)
-
-        db.session.commit()  # Подтверждаем транзакцию
-
+        # Сериализуем до commit, чтобы не перечитывать строку после expire
+        payload = user.to_dict()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "This username or email already exists"}), 400
     except Exception as e:
         db.session.rollback()  # Откат транзакции в случае ошибки
         return jsonify({"error": str(e)}), 500
 
     return (
-        jsonify({"Message": "User created successfully", "user": user.to_dict()}),
+        jsonify({"Message": "User created successfully", "user": payload}),
         201,
     )
 
 
+@user_blueprint.route("/admin-create", methods=["POST"])
+def create_admin():
+    return create_user(RoleEnum.ADMIN)
 
 
 @user_blueprint.route("/buyer-create", methods=["POST"])
 def create_buyer():
-    data = request.get_json()
-    if not data or not all(k in data for k in ["username", "email", "password"]):
-        return jsonify({"error": "Invalid data"}), 400
-
-    if (
-        User.query.filter_by(username=data["username"]).first()
-        or User.query.filter_by(email=data["email"]).first()
-    ):
-        return jsonify({"message": "This username or email already exists"}), 400
-
-    user = User(username=data["username"], email=data["email"])
-    user.set_password(data["password"])
-
-    try:
-        # Начало транзакции
-        with db.session.no_autoflush:
-            user_role = Role.query.filter_by(name=RoleEnum.BUYER).first()
-            if not user_role:
-                user_role = Role(name=RoleEnum.BUYER)
-                db.session.add(user_role)
-
-            user_group = Group.query.filter_by(name=GroupEnum.BUYER).first()
-            if not user_group:
-                user_group = Group(name=GroupEnum.BUYER)
-                db.session.add(user_group)
-
-            db.session.flush()
-
-            user.role = user_role
-            user.group = user_group
-            db.session.add(user)
-
-            permissions = [Permission(name=PermissionEnum.LIST_VIEW)]
-
-            for perm in permissions:
-                existing_perm = Permission.query.filter_by(name=perm.name).first()
-                if not existing_perm:
-                    db.session.add(perm)
-                else:
-                    permissions[permissions.index(perm)] = existing_perm
-
-            db.session.flush()
-
-            for perm in permissions:
-                if not PermissionGroup.query.filter_by(
-                    group_id=user_group.id, permission_id=perm.id
-                ).first():
-                    group_perm = PermissionGroup(
-                        group_id=user_group.id, permission_id=perm.id
-                    )
-                    db.session.add(group_perm)
-
-            db.session.commit()  # Подтверждение транзакции
-
-    except Exception as e:
-        db.session.rollback()  # Откат транзакции в случае ошибки
-        return jsonify({"error": str(e)}), 500
-
-    return (
-        jsonify({"Message": "User created successfully", "user": user.to_dict()}),
-        201,
-    )
+    return create_user(RoleEnum.BUYER)
 
 
 @user_blueprint.route("/login", methods=["POST"])
+@query_budget(1)
 def login():
     data = request.get_json()
 
     email = data.get("email")
     password = data.get("password")
 
+    retry_after = login_rate_limiter.check(email, request.remote_addr)
+    if retry_after is not None:
+        response = jsonify({"error": "Too many login attempts, try again later"})
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return response, 429
+
     user = User.query.filter_by(email=email).first()
 
-    if not user or not user.check_password(password):
+    if not user:
+        return jsonify({"error": "Bad email or password"}), 401
+
+    try:
+        is_valid = password_hasher.verify(user.password_hash, password)
+    except HasherBusy:
+        return jsonify({"error": "Too many login attempts, try again later"}), 503
+
+    if not is_valid:
         return jsonify({"error": "Bad email or password"}), 401
 
+    method = current_hash_method()
+    if needs_rehash(user.password_hash, method):
+        password_hasher.rehash_in_background(
+            user.id, user.password_hash, password, method
+        )
+
     expires = timedelta(hours=1)
     access_token = create_access_token(identity=user.id, expires_delta=expires)
     return jsonify(access_token=access_token), 201
 
 
 @user_blueprint.route("/all-users", methods=["GET"])
+@query_budget(1)
 def get_user():
-    users = User.query.all()
-    return ([user.to_dict() for user in users]), 200
+    query = db.session.query(*USER_COLUMNS).order_by(User.id)
+    if wants_ndjson():
+        return ndjson_response(query)
+    return rows_to_dicts(query.all()), 200
+
+
+@user_blueprint.route("/batch", methods=["GET"])
+@query_budget(1)
+def get_users_batch():
+    try:
+        payload = batch_payload("users", USER_COLUMNS)
+    except InvalidIds:
+        return jsonify({"error": "Invalid ids"}), 400
+    return jsonify(payload), 200
@@ -1,23 +1,76 @@
+import io
+import json
 import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
+import openpyxl
 import pytest
+from flask import jsonify
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
 import tempfile
+import threading
+import time
 
 from app import create_app
-from app.extensions import db
-from models.user_models import GroupEnum, Group, RoleEnum, Role, User
-from models.product_models import Product, Category
+from app.extensions import db, xlsx_export
+from app import json_provider
+from app.batch import get_by_ids
+from app.database import engine_options
+from app.settings import env_config
+from app.idempotency import idempotency_store, idempotent
+from app.metrics import metrics
+from app.pagination import encode_cursor
+from app.passwords import HasherBusy, PasswordHasher, password_hasher
+from app.permissions import PermissionCache, get_user_permissions, permission_cache
+from app.purge import purge_worker
+from app.query_counter import QueryBudgetExceeded
+from app.rate_limit import LoginRateLimiter, MemoryBackend, RedisBackend
+from app.response_cache import ResponseCache, response_cache
+from app.serializers import USER_COLUMNS
+from app.serving import ShopApplication, parse_options, post_fork
+from app.xlsx_export import XlsxExportQueue
+from models.user_models import (
+    GroupEnum,
+    Group,
+    Permission,
+    PermissionEnum,
+    PermissionGroup,
+    RoleEnum,
+    Role,
+    User,
+)
+from models.idempotency_models import IdempotencyKey
+from models.order_models import Order, OrderItem
+from models.product_models import (
+    Product,
+    Category,
+    CategoryStats,
+    ProductPriceHistory,
+    rebuild_category_paths,
+)
+
+
+TEST_CONFIG = {
+    "SECRET_KEY": "test",
+    "JWT_SECRET_KEY": "test",
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+    # Очистку удаленных строк тесты запускают сами, без фонового потока
+    "PURGE_IN_BACKGROUND": False,
+    # Выгрузка XLSX пишет во временный каталог, а не в xlsx_files/ репозитория
+    "XLSX_EXPORT_FILE": os.path.join(tempfile.mkdtemp(), "product_list.xlsx"),
+}
 
 
 @pytest.fixture()
 def app():
     db_fd, db_path = tempfile.mkstemp()
-    app = create_app()
-    app.config.update(
-        {
-            "TESTING": True,
-            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
-        }
+    # Адрес базы передаем сразу: движок создается внутри create_app
+    app = create_app(
+        TEST_CONFIG, TESTING=True, SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}"
     )
     with app.app_context():
         db.create_all()
@@ -43,6 +96,7 @@ def app():
 
     with app.app_context():
         db.drop_all()
+        db.engine.dispose()
 
     os.close(db_fd)
     os.unlink(db_path)
@@ -225,3 +279,2009 @@ def test_create_product(app, client):
     assert json_data["Message"] == "Product create successfully"
     assert "product" in json_data
 
+
+
+def test_create_product_validates_price_and_stock(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    headers = _admin_headers(client)
+    data = {"category_id": category.id, "name": "A", "title": "t", "price": 10}
+
+    for field, value in (
+        ("price", "abc"),
+        ("price", True),
+        ("price", 9.5),
+        ("price", 2**31),
+        ("stock", -1),
+        ("stock", 2**31),
+    ):
+        response = client.post(
+            "/products/product-create",
+            json=dict(data, **{field: value}),
+            headers=headers,
+        )
+        assert response.status_code == 400
+        assert response.get_json()["error"] == f"Invalid {field}"
+
+    assert Product.query.count() == 0
+    response = client.post("/products/product-create", json=data, headers=headers)
+    assert response.status_code == 201
+    assert _stats(client, category.id)["max_price"] == 10
+
+
+def _seed_products(count, category_id=None):
+    products = [
+        Product(
+            name=f"Phone {i:03d}",
+            title="phone",
+            price=100 + (i % 7) * 10,
+            category_id=category_id,
+        )
+        for i in range(count)
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return products
+
+
+def test_product_list_keyset_pagination(client):
+    _seed_products(25)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 10, "sort": "price", "order": "desc"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/products/product-list", query_string=params)
+        assert response.status_code == 200
+        json_data = response.get_json()
+        assert len(json_data["products"]) <= 10
+        seen.extend(json_data["products"])
+        cursor = json_data["next"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 25
+    assert len({product["id"] for product in seen}) == 25
+    keys = [(product["price"], product["id"]) for product in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_product_list_created_at_cursor(client):
+    _seed_products(5)
+
+    first = client.get("/products/product-list?limit=2").get_json()
+    second = client.get(
+        "/products/product-list", query_string={"limit": 2, "cursor": first["next"]}
+    ).get_json()
+
+    first_ids = [product["id"] for product in first["products"]]
+    second_ids = [product["id"] for product in second["products"]]
+    assert not set(first_ids) & set(second_ids)
+    assert first_ids + second_ids == sorted(first_ids + second_ids)
+
+
+def test_product_list_filters(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    _seed_products(10, category_id=category.id)
+    db.session.add(Product(name="Phone_x", title="other", price=150))
+    db.session.commit()
+
+    response = client.get(
+        "/products/product-list",
+        query_string={
+            "category_id": category.id,
+            "min_price": 120,
+            "max_price": 140,
+            "name": "Phone 00",
+        },
+    )
+    assert response.status_code == 200
+    products = response.get_json()["products"]
+    assert products
+    assert all(120 <= product["price"] <= 140 for product in products)
+    assert all(product["name"].startswith("Phone 00") for product in products)
+
+    response = client.get("/products/product-list", query_string={"name": "Phone_"})
+    assert [product["name"] for product in response.get_json()["products"]] == [
+        "Phone_x"
+    ]
+
+
+def test_product_list_invalid_cursor(client):
+    response = client.get("/products/product-list?cursor=garbage")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid cursor"
+
+    _seed_products(3)
+    cursor = client.get("/products/product-list?limit=1").get_json()["next"]
+    response = client.get(
+        "/products/product-list", query_string={"cursor": cursor, "sort": "price"}
+    )
+    assert response.status_code == 400
+
+    # Подделанные значения цены и id в курсоре - тоже 400, а не 500
+    for value, last_id in (("abc", 1), (True, 1), (1.5, 1), (10, "1"), (10, True)):
+        cursor = encode_cursor("price", "asc", value, last_id)
+        response = client.get(
+            "/products/product-list", query_string={"cursor": cursor, "sort": "price"}
+        )
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Invalid cursor"
+
+
+def test_xlsx_export_queue_coalesces_and_flushes(tmp_path):
+    file_name = str(tmp_path / "xlsx" / "products.xlsx")
+    export_queue = XlsxExportQueue(file_name=file_name, batch_size=1000)
+
+    first = Product(id=1, name="A", title="a", price=10, category_id=None)
+    second = Product(id=2, name="B", title="b", price=20, category_id=None)
+    # Поток не запускаем, проверяем буфер и синхронный flush
+    export_queue._ensure_worker = lambda: None
+    export_queue.enqueue(first)
+    export_queue.enqueue(second)
+    first.price = 15
+    export_queue.enqueue(first)
+
+    assert export_queue.queue_depth() == 2
+    assert export_queue.flush() == 2
+    assert export_queue.queue_depth() == 0
+    assert export_queue.status()["last_flush_rows"] == 2
+
+    export_queue.enqueue(Product(id=3, name="C", title="c", price=30))
+    export_queue.flush()
+
+    worksheet = openpyxl.load_workbook(file_name).active
+    rows = list(worksheet.iter_rows(values_only=True))
+    assert rows[0][0] == "Product ID"
+    assert [(row[0], row[3]) for row in rows[1:]] == [(1, 15), (2, 20), (3, 30)]
+
+
+def test_xlsx_export_worker_flushes_on_batch_size(tmp_path):
+    file_name = str(tmp_path / "products.xlsx")
+    export_queue = XlsxExportQueue(file_name=file_name, batch_size=2, flush_interval=30)
+
+    export_queue.enqueue(Product(id=1, name="A", title="a", price=10))
+    export_queue.enqueue(Product(id=2, name="B", title="b", price=20))
+
+    for _ in range(100):
+        if export_queue.flushed_total == 2:
+            break
+        time.sleep(0.05)
+    assert export_queue.flushed_total == 2
+    assert os.path.exists(file_name)
+
+
+def test_xlsx_export_processes_do_not_lose_rows(tmp_path):
+    file_name = str(tmp_path / "products.xlsx")
+    # Несколько процессов пишут в один файл, как воркеры gunicorn
+    code = (
+        "import sys\n"
+        "from app.xlsx_export import write_rows_to_xlsx\n"
+        "worker = int(sys.argv[2])\n"
+        "for batch in range(5):\n"
+        "    rows = [(worker * 100 + batch * 10 + i, 'n', 't', 1, None, None)"
+        " for i in range(5)]\n"
+        "    write_rows_to_xlsx(sys.argv[1], rows)\n"
+    )
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processes = [
+        subprocess.Popen([sys.executable, "-c", code, file_name, str(worker)], cwd=cwd)
+        for worker in range(4)
+    ]
+    assert [process.wait(timeout=60) for process in processes] == [0] * 4
+
+    rows = list(openpyxl.load_workbook(file_name).active.iter_rows(values_only=True))
+    assert len(rows) == 1 + 4 * 5 * 5
+    assert len({row[0] for row in rows[1:]}) == 100
+
+
+def test_xlsx_export_moves_unreadable_file_aside(tmp_path):
+    file_name = str(tmp_path / "products.xlsx")
+    with open(file_name, "wb") as broken:
+        broken.write(b"half a zip")
+    export_queue = XlsxExportQueue(file_name=file_name)
+    export_queue._ensure_worker = lambda: None
+
+    export_queue.enqueue(Product(id=1, name="A", title="a", price=10))
+    assert export_queue.flush() == 1
+    rows = list(openpyxl.load_workbook(file_name).active.iter_rows(values_only=True))
+    assert [row[0] for row in rows] == ["Product ID", 1]
+    assert [path.name.split(".broken-")[0] for path in tmp_path.glob("*.broken-*")] == [
+        "products.xlsx"
+    ]
+
+
+def test_xlsx_export_writes_in_native_thread_under_gevent(tmp_path):
+    pytest.importorskip("gevent")
+    code = (
+        "from gevent import monkey\n"
+        "monkey.patch_all()\n"
+        "import sys\n"
+        "from gevent.monkey import get_original\n"
+        "import importlib\n"
+        "xlsx_export = importlib.import_module('app.xlsx_export')\n"
+        "from models.product_models import Product\n"
+        "get_ident = get_original('_thread', 'get_ident')\n"
+        "write, idents = xlsx_export.write_rows_to_xlsx, []\n"
+        "def recording_write(*args):\n"
+        "    idents.append(get_ident())\n"
+        "    write(*args)\n"
+        "xlsx_export.write_rows_to_xlsx = recording_write\n"
+        "queue = xlsx_export.XlsxExportQueue(file_name=sys.argv[1])\n"
+        "queue._ensure_worker = lambda: None\n"
+        "queue.enqueue(Product(id=1, name='A', title='a', price=10))\n"
+        "print(queue.flush(), idents != [get_ident()])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code, str(tmp_path / "products.xlsx")],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["1", "True"]
+
+
+def test_export_status(client):
+    response = client.get("/products/export-status")
+    assert response.status_code == 200
+    json_data = response.get_json()
+    assert json_data["queue_depth"] == 0
+    assert "last_flush_at" in json_data
+
+
+def test_export_products_csv_and_ndjson(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    _seed_products(3, category_id=category.id)
+
+    response = client.get("/products/export?format=csv")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    lines = response.get_data(as_text=True).strip().splitlines()
+    assert lines[0].startswith("Product ID,Name,Title")
+    assert len(lines) == 4
+    assert "Phones" in lines[1]
+
+    response = client.get("/products/export?format=ndjson")
+    assert response.status_code == 200
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [item["name"] for item in items] == ["Phone 000", "Phone 001", "Phone 002"]
+    assert all(item["category"] == "Phones" for item in items)
+
+
+def test_export_products_xlsx(client):
+    _seed_products(2)
+
+    response = client.get("/products/export?format=xlsx")
+    assert response.status_code == 200
+    workbook = openpyxl.load_workbook(io.BytesIO(response.get_data()))
+    rows = list(workbook.active.iter_rows(values_only=True))
+    assert rows[0][0] == "Product ID"
+    assert len(rows) == 3
+
+
+def test_export_products_invalid_format(client):
+    response = client.get("/products/export?format=pdf")
+    assert response.status_code == 400
+
+
+def _admin_headers(client):
+    data = {"username": "admin", "email": "admin@mail.ru", "password": "admin12345"}
+    client.post("/users/admin-create", json=data)
+    response = client.post(
+        "/users/login", json={"email": data["email"], "password": data["password"]}
+    )
+    token = response.get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_import_products_csv(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    headers = _admin_headers(client)
+
+    content = (
+        "name,title,price,category_id\n"
+        f"Samsung,cool phone,300,{category.id}\n"
+        "Nokia,old phone,abc,\n"
+        "Apple,phone,500,9999\n"
+        ",no name,100,\n"
+        "Xiaomi,phone,200,\n"
+    )
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO(content.encode()), "feed.csv")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report["total"] == 5
+    assert report["inserted"] == 2
+    assert report["error_count"] == 3
+    assert report["errors"] == [
+        {"row": 3, "error": "Invalid price"},
+        {"row": 4, "error": "Category id not found"},
+        {"row": 5, "error": "Missing fields: name"},
+    ]
+    assert Product.query.count() == 2
+    assert Product.query.filter_by(name="Samsung").first().category_id == category.id
+
+
+def test_import_products_ndjson_and_xlsx(client):
+    headers = _admin_headers(client)
+
+    lines = [json.dumps({"name": f"P{i}", "title": "t", "price": i}) for i in range(5)]
+    lines.insert(2, "not json")
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO("\n".join(lines).encode()), "feed.ndjson")},
+        headers=headers,
+    )
+    report = response.get_json()
+    assert report["inserted"] == 5
+    assert report["errors"] == [{"row": 3, "error": "Invalid JSON"}]
+
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["name", "title", "price", "category_id"])
+    workbook.active.append(["X1", "t", 10, None])
+    workbook.active.append(["X2", "t", 10.5, None])
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    response = client.post(
+        "/products/import",
+        data={"file": (output, "feed.xlsx")},
+        headers=headers,
+    )
+    report = response.get_json()
+    assert report["inserted"] == 1
+    assert report["errors"] == [{"row": 3, "error": "Invalid price"}]
+    assert Product.query.count() == 6
+
+
+def test_import_products_invalid_file(client):
+    headers = _admin_headers(client)
+
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO(b"garbage"), "feed.xlsx")},
+        headers=headers,
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid file"
+
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO(b""), "feed.pdf")},
+        headers=headers,
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid format"
+
+
+def test_import_products_rejects_out_of_range_numbers(client):
+    headers = _admin_headers(client)
+
+    lines = [
+        json.dumps({"name": "Big", "title": "t", "price": 1e30}),
+        json.dumps({"name": "Huge", "title": "t", "price": "99999999999"}),
+        json.dumps({"name": "Deep", "title": "t", "price": 1, "stock": 2**31}),
+        json.dumps({"name": "Max", "title": "t", "price": 2**31 - 1}),
+    ]
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO("\n".join(lines).encode()), "feed.ndjson")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report["inserted"] == 1
+    assert report["errors"] == [
+        {"row": 1, "error": "Invalid price"},
+        {"row": 2, "error": "Invalid price"},
+        {"row": 3, "error": "Invalid stock"},
+    ]
+
+
+def test_import_products_reports_file_error_after_committed_chunks(client):
+    headers = _admin_headers(client)
+
+    content = "name,title,price\n" + "".join(f"P{i},t,{i}\n" for i in range(1500))
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO(content.encode() + b"Bad,t,1\xff\n"), "feed.csv")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    report = response.get_json()
+    # Файл декодируется блоками, поэтому ошибка всплывает до последних строк,
+    # но уже после первого закоммиченного чанка
+    assert report["inserted"] == report["total"] > 1000
+    assert report["error_count"] == 1
+    assert report["errors"][0]["row"] is None
+    assert report["errors"][0]["error"].startswith("Invalid file")
+    assert Product.query.count() == report["inserted"]
+
+
+def test_import_products_requires_admin(client):
+    client.post(
+        "/users/buyer-create",
+        json={"username": "user", "email": "user@mail.ru", "password": "user12345"},
+    )
+    token = client.post(
+        "/users/login", json={"email": "user@mail.ru", "password": "user12345"}
+    ).get_json()["access_token"]
+
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO(b"name,title,price\n"), "feed.csv")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 403
+
+
+def _seed_category_tree():
+    electronics = Category(name="Electronics")
+    db.session.add(electronics)
+    db.session.commit()
+    phones = Category(name="Phones", parent_id=electronics.id)
+    laptops = Category(name="Laptops", parent_id=electronics.id)
+    db.session.add_all([phones, laptops])
+    db.session.commit()
+    android = Category(name="Android", parent_id=phones.id)
+    food = Category(name="Food")
+    db.session.add_all([android, food])
+    db.session.commit()
+    return electronics, phones, laptops, android, food
+
+
+def test_category_path_is_materialized(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+
+    assert electronics.path == f"/{electronics.id}/"
+    assert android.path == f"/{electronics.id}/{phones.id}/{android.id}/"
+
+    response = client.post(
+        "/products/categories", json={"name": "iPhone", "parent_id": phones.id}
+    )
+    category_id = response.get_json()["category"]["id"]
+    assert db.session.get(Category, category_id).path == f"{phones.path}{category_id}/"
+
+
+def test_rebuild_category_paths(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+    db.session.execute(db.update(Category).values(path=None))
+    db.session.commit()
+
+    assert rebuild_category_paths() == 5
+    db.session.expire_all()
+    assert db.session.get(Category, android.id).path == (
+        f"/{electronics.id}/{phones.id}/{android.id}/"
+    )
+
+
+def test_category_tree(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+
+    response = client.get("/products/categories/tree")
+    assert response.status_code == 200
+    tree = response.get_json()
+    assert {node["name"] for node in tree} == {"Electronics", "Food"}
+    root = next(node for node in tree if node["name"] == "Electronics")
+    assert {node["name"] for node in root["children"]} == {"Phones", "Laptops"}
+    phones_node = next(node for node in root["children"] if node["name"] == "Phones")
+    assert [node["name"] for node in phones_node["children"]] == ["Android"]
+
+    response = client.get(f"/products/categories/tree?root_id={phones.id}")
+    assert [node["name"] for node in response.get_json()] == ["Phones"]
+
+
+def test_products_by_category_include_descendants(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+    db.session.add_all(
+        [
+            Product(name="Pixel", title="t", price=1, category_id=android.id),
+            Product(name="MacBook", title="t", price=1, category_id=laptops.id),
+            Product(name="Apple", title="t", price=1, category_id=food.id),
+        ]
+    )
+    db.session.commit()
+
+    response = client.get(f"/products/category/{electronics.id}/products")
+    assert response.status_code == 404
+
+    response = client.get(
+        f"/products/category/{electronics.id}/products?include_descendants=1"
+    )
+    assert response.status_code == 200
+    names = {product["name"] for product in response.get_json()["products"]}
+    assert names == {"Pixel", "MacBook"}
+
+
+def test_categories_cached_with_etag(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+
+    response = client.get("/products/categories")
+    assert response.status_code == 200
+    assert [cat["name"] for cat in response.get_json()] == [
+        "Electronics",
+        "Phones",
+        "Laptops",
+        "Android",
+        "Food",
+    ]
+    etag = response.headers["ETag"]
+
+    response = client.get("/products/categories", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+
+    response = client.get(f"/products/categories?parent_id={electronics.id}")
+    assert [cat["name"] for cat in response.get_json()] == ["Phones", "Laptops"]
+
+    client.post("/products/categories", json={"name": "Books"})
+    response = client.get("/products/categories", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "Books" in [cat["name"] for cat in response.get_json()]
+
+    client.delete(f"/products/categories/{food.id}", headers=_admin_headers(client))
+    response = client.get("/products/categories")
+    assert "Food" not in [cat["name"] for cat in response.get_json()]
+
+
+def test_category_cache_serves_without_queries(client, app):
+    _seed_category_tree()
+    client.get("/products/categories/tree")
+
+    responses = []
+    statements = _count_statements(
+        lambda: responses.extend(
+            [
+                client.get("/products/categories/tree"),
+                client.get("/products/categories"),
+            ]
+        )
+    )
+
+    assert all(response.status_code == 200 for response in responses)
+    assert statements == []
+
+
+def _count_statements(func):
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+    return statements
+
+
+def test_require_permission_uses_cache(client):
+    headers = _admin_headers(client)
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    data = {"category_id": category.id, "name": "Samsung", "title": "t", "price": 1}
+
+    response = client.post("/products/product-create", json=data, headers=headers)
+    assert response.status_code == 201
+
+    statements = _count_statements(
+        lambda: client.post("/products/product-create", json=data, headers=headers)
+    )
+    assert not any("permissions" in statement for statement in statements)
+
+
+def test_require_permission_denies_buyer(client):
+    client.post(
+        "/users/buyer-create",
+        json={"username": "user", "email": "user@mail.ru", "password": "user12345"},
+    )
+    token = client.post(
+        "/users/login", json={"email": "user@mail.ru", "password": "user12345"}
+    ).get_json()["access_token"]
+
+    response = client.post(
+        "/products/product-create",
+        json={"category_id": None, "name": "A", "title": "t", "price": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 403
+    assert response.get_json()["error"] == "Access denied"
+
+
+def test_permission_cache_invalidated_on_group_change(client):
+    client.post(
+        "/users/buyer-create",
+        json={"username": "user", "email": "user@mail.ru", "password": "user12345"},
+    )
+    user = User.query.filter_by(email="user@mail.ru").first()
+    assert get_user_permissions(user.id)[1] == {PermissionEnum.LIST_VIEW}
+
+    create_update = Permission.query.filter_by(
+        name=PermissionEnum.CREATE_UPDATE
+    ).first()
+    db.session.add(
+        PermissionGroup(group_id=user.group_id, permission_id=create_update.id)
+    )
+    # До commit кэш еще не сброшен
+    assert permission_cache.get(user.id) is not None
+    db.session.commit()
+
+    assert permission_cache.get(user.id) is None
+    assert get_user_permissions(user.id)[1] == {
+        PermissionEnum.LIST_VIEW,
+        PermissionEnum.CREATE_UPDATE,
+    }
+
+
+def test_permission_cache_lru_and_ttl():
+    cache = PermissionCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+
+    cache = PermissionCache(maxsize=2, ttl=0)
+    cache.set(1, "a")
+    assert cache.get(1) is None
+
+
+def test_signup_uses_role_registry(client):
+    client.post(
+        "/users/buyer-create",
+        json={"username": "user1", "email": "user1@mail.ru", "password": "user12345"},
+    )
+
+    statements = _count_statements(
+        lambda: client.post(
+            "/users/buyer-create",
+            json={
+                "username": "user2",
+                "email": "user2@mail.ru",
+                "password": "user12345",
+            },
+        )
+    )
+    assert [statement.split()[0] for statement in statements] == ["INSERT"]
+
+    user = User.query.filter_by(username="user2").first()
+    assert user.role.name == RoleEnum.BUYER
+    assert user.group.name == GroupEnum.BUYER
+
+
+def test_seed_roles_is_idempotent(app):
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=["seed-roles"]).exit_code == 0
+    assert runner.invoke(args=["seed-roles"]).exit_code == 0
+
+    admin_group = Group.query.filter_by(name=GroupEnum.ADMIN).first()
+    buyer_group = Group.query.filter_by(name=GroupEnum.BUYER).first()
+    assert Role.query.count() == 2
+    assert PermissionGroup.query.filter_by(group_id=admin_group.id).count() == 3
+    assert PermissionGroup.query.filter_by(group_id=buyer_group.id).count() == 1
+
+
+def test_login_rehashes_outdated_password(client, app):
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+    client.post(
+        "/users/buyer-create",
+        json={"username": "user", "email": "user@mail.ru", "password": "user12345"},
+    )
+    user = User.query.filter_by(email="user@mail.ru").first()
+    assert user.password_hash.startswith("pbkdf2:sha256:1000$")
+
+    app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+    response = client.post(
+        "/users/login", json={"email": "user@mail.ru", "password": "user12345"}
+    )
+    assert response.status_code == 201
+
+    # Дожидаемся фоновой задачи перехеширования
+    password_hasher.shutdown()
+    db.session.expire_all()
+    user = User.query.filter_by(email="user@mail.ru").first()
+    assert user.password_hash.startswith("pbkdf2:sha256:2000$")
+    assert user.check_password("user12345")
+
+    response = client.post(
+        "/users/login", json={"email": "user@mail.ru", "password": "wrong"}
+    )
+    assert response.status_code == 401
+
+
+def test_password_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(workers=1, max_pending=0)
+    release = threading.Event()
+    try:
+        hasher.submit(release.wait)
+        with pytest.raises(HasherBusy):
+            hasher.submit(release.wait)
+    finally:
+        release.set()
+        hasher.shutdown()
+
+
+class FakeRedis:
+    """Minimal stand-in for the redis-py sorted set commands."""
+
+    def __init__(self):
+        self.sets = {}
+        self.expires = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def zremrangebyscore(self, key, min_score, max_score):
+        members = self.sets.setdefault(key, {})
+        for member, score in list(members.items()):
+            if min_score <= score <= max_score:
+                del members[member]
+
+    def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update(mapping)
+
+    def zcard(self, key):
+        return len(self.sets.get(key, {}))
+
+    def zrem(self, key, member):
+        self.sets.get(key, {}).pop(member, None)
+
+    def zrange(self, key, start, end, withscores=False):
+        items = sorted(self.sets.get(key, {}).items(), key=lambda item: item[1])
+        items = items[start : end + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def expire(self, key, seconds):
+        self.expires[key] = seconds
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        return [
+            getattr(self.client, name)(*args, **kwargs)
+            for name, args, kwargs in self.calls
+        ]
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [MemoryBackend, lambda: RedisBackend(FakeRedis())],
+    ids=["memory", "redis"],
+)
+def test_rate_limit_backend_sliding_window(backend):
+    backend = backend()
+    assert backend.hit("key", 2, 10, now=100.0) == (True, 0.0)
+    assert backend.hit("key", 2, 10, now=101.0) == (True, 0.0)
+    allowed, retry_after = backend.hit("key", 2, 10, now=105.0)
+    assert not allowed
+    assert retry_after == pytest.approx(5.0)
+    assert backend.hit("other", 2, 10, now=105.0) == (True, 0.0)
+    assert backend.hit("key", 2, 10, now=110.5)[0]
+
+
+def test_login_rate_limited_before_db(client, app):
+    client.post(
+        "/users/buyer-create",
+        json={"username": "user", "email": "user@mail.ru", "password": "user12345"},
+    )
+    login_data = {"email": "user@mail.ru", "password": "wrong"}
+    for _ in range(app.config["LOGIN_RATE_LIMIT_PER_EMAIL"]):
+        assert client.post("/users/login", json=login_data).status_code == 401
+
+    responses = []
+    statements = _count_statements(
+        lambda: responses.append(client.post("/users/login", json=login_data))
+    )
+    assert responses[0].status_code == 429
+    assert int(responses[0].headers["Retry-After"]) > 0
+    assert statements == []
+
+    # Другой email с того же IP пока проходит
+    response = client.post(
+        "/users/login", json={"email": "other@mail.ru", "password": "x"}
+    )
+    assert response.status_code == 401
+
+
+def test_login_rate_limiter_per_ip():
+    limiter = LoginRateLimiter(per_email=100, per_ip=2, window=60)
+    assert limiter.check("a@mail.ru", "10.0.0.1") is None
+    assert limiter.check("b@mail.ru", "10.0.0.1") is None
+    assert limiter.check("c@mail.ru", "10.0.0.1") is not None
+    assert limiter.check("c@mail.ru", "10.0.0.2") is None
+
+
+def test_list_endpoints_match_to_dict(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    products = _seed_products(3, category_id=category.id)
+    expected = {product.id: product.to_dict() for product in products}
+
+    response = client.get("/products/product-list")
+    assert {item["id"]: item for item in response.get_json()["products"]} == expected
+
+    response = client.get(f"/products/category/{category.id}/products")
+    assert {item["id"]: item for item in response.get_json()["products"]} == expected
+
+    response = client.get("/products/categories")
+    assert response.get_json() == [category.to_dict()]
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "stdlib"])
+def test_fast_json_provider(app, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(json_provider, "orjson", None)
+    elif json_provider.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    data = {"b": 1, "a": "Привет", "created_at": created_at}
+
+    dumped = app.json.dumps(data)
+    assert json.loads(dumped) == {
+        "a": "Привет",
+        "b": 1,
+        "created_at": created_at.isoformat(),
+    }
+    assert app.json.loads(dumped)["b"] == 1
+
+    response = app.json.response(data)
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data())["created_at"] == created_at.isoformat()
+
+
+def test_product_list_ndjson_stream(client):
+    _seed_products(2500)
+
+    response = client.get(
+        "/products/product-list?sort=price&order=desc",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.is_streamed
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(items) == 2500
+    keys = [(item["price"], item["id"]) for item in items]
+    assert keys == sorted(keys, reverse=True)
+
+    response = client.get("/products/product-list?stream=1&min_price=160")
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert items
+    assert all(item["price"] >= 160 for item in items)
+
+
+def test_all_users_ndjson_stream(client):
+    for i in range(3):
+        client.post(
+            "/users/buyer-create",
+            json={
+                "username": f"user{i}",
+                "email": f"user{i}@mail.ru",
+                "password": "user12345",
+            },
+        )
+
+    response = client.get("/users/all-users?stream=1")
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["username"] for line in lines] == [
+        "user0",
+        "user1",
+        "user2",
+    ]
+
+    response = client.get("/users/all-users")
+    assert response.mimetype == "application/json"
+
+
+def test_query_budgets_hold_with_data(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+    for category in (phones, laptops, android):
+        _seed_products(5, category_id=category.id)
+    headers = _admin_headers(client)
+    for i in range(5):
+        client.post(
+            "/users/buyer-create",
+            json={"username": f"u{i}", "email": f"u{i}@mail.ru", "password": "x"},
+        )
+
+    # В тестах превышение бюджета поднимает QueryBudgetExceeded
+    budgets = {
+        "/products/product-list?limit=10": 2,
+        "/products/categories": 1,
+        "/products/categories/tree": 1,
+        f"/products/category/{electronics.id}/products?include_descendants=1": 3,
+        "/users/all-users": 1,
+    }
+    for url, budget in budgets.items():
+        response = client.get(url)
+        assert response.status_code == 200, url
+        assert int(response.headers["X-Query-Count"]) <= budget, url
+
+    response = client.post(
+        "/products/product-create",
+        json={"category_id": phones.id, "name": "A", "title": "t", "price": 1},
+        headers=headers,
+    )
+    assert response.status_code == 201
+
+    android_id = android.id
+    response = client.delete(f"/products/categories/{android_id}", headers=headers)
+    assert response.status_code == 200
+    purge_worker.run()
+    assert Product.query.filter_by(category_id=android_id).count() == 0
+
+
+def test_query_counter_flags_repeated_statements(app):
+    @app.route("/n-plus-one")
+    def n_plus_one():
+        for category_id in range(5):
+            db.session.get(Category, category_id)
+        return "ok"
+
+    with pytest.raises(QueryBudgetExceeded, match="repeated 5 times"):
+        app.test_client().get("/n-plus-one")
+
+    app.config["QUERY_BUDGET_RAISE"] = False
+    response = app.test_client().get("/n-plus-one")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "5"
+
+
+def test_reads_routed_to_replica(tmp_path):
+    replica_app = create_app(
+        TEST_CONFIG,
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        DATABASE_REPLICA_URL=f"sqlite:///{tmp_path / 'replica.db'}",
+    )
+
+    with replica_app.app_context():
+        db.create_all()
+        replica = replica_app.extensions["db_replica"]
+        db.metadata.create_all(replica)
+        with replica.begin() as connection:
+            connection.execute(
+                db.insert(Product), [{"name": "From replica", "title": "t", "price": 1}]
+            )
+
+        client = replica_app.test_client()
+        response = client.post("/products/categories", json={"name": "Primary"})
+        assert response.status_code == 201
+
+        response = client.get("/products/product-list")
+        assert [item["name"] for item in response.get_json()["products"]] == [
+            "From replica"
+        ]
+        # Категория записана в основную базу, реплика ее еще не видит
+        assert client.get("/products/categories").get_json() == []
+        assert Category.query.count() == 1
+        assert Product.query.count() == 0
+
+
+def test_engine_options_from_config():
+    config = {
+        "DB_POOL_PRE_PING": True,
+        "DB_POOL_RECYCLE": 600,
+        "DB_POOL_SIZE": 5,
+        "DB_MAX_OVERFLOW": 7,
+        "DB_POOL_TIMEOUT": 3,
+        "DB_STATEMENT_TIMEOUT_MS": 2000,
+    }
+
+    options = engine_options(config, "postgresql://user@localhost/shop")
+    assert options["pool_size"] == 5
+    assert options["max_overflow"] == 7
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"options": "-c statement_timeout=2000"}
+
+    options = engine_options(config, "sqlite:///shop.db")
+    assert "pool_size" not in options
+    assert options["pool_recycle"] == 600
+
+
+def test_search_products_prefix_ranking_and_filters(client):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+    db.session.add_all(
+        [
+            Product(
+                name="Samsung Galaxy",
+                title="android phone",
+                price=300,
+                category_id=android.id,
+            ),
+            Product(
+                name="Samsung Book", title="laptop", price=900, category_id=laptops.id
+            ),
+            Product(
+                name="Pixel",
+                title="Samsung killer phone",
+                price=500,
+                category_id=android.id,
+            ),
+            Product(
+                name="Молоко", title="молочный продукт", price=2, category_id=food.id
+            ),
+        ]
+    )
+    db.session.commit()
+
+    response = client.get("/products/search?q=sams")
+    assert response.status_code == 200
+    names = [item["name"] for item in response.get_json()["products"]]
+    assert set(names) == {"Samsung Galaxy", "Samsung Book", "Pixel"}
+
+    response = client.get("/products/search?q=sams pho")
+    names = [item["name"] for item in response.get_json()["products"]]
+    assert set(names) == {"Samsung Galaxy", "Pixel"}
+
+    response = client.get("/products/search?q=молоч")
+    assert [item["name"] for item in response.get_json()["products"]] == ["Молоко"]
+
+    response = client.get(
+        "/products/search",
+        query_string={
+            "q": "samsung",
+            "category_id": electronics.id,
+            "include_descendants": 1,
+            "max_price": 600,
+        },
+    )
+    names = {item["name"] for item in response.get_json()["products"]}
+    assert names == {"Samsung Galaxy", "Pixel"}
+
+    response = client.get(
+        "/products/search", query_string={"q": "samsung", "category_id": laptops.id}
+    )
+    assert [item["name"] for item in response.get_json()["products"]] == [
+        "Samsung Book"
+    ]
+
+
+def test_search_index_follows_updates_and_deletes(client):
+    product = Product(name="Nokia", title="phone", price=10)
+    db.session.add(product)
+    db.session.commit()
+    assert client.get("/products/search?q=nok").get_json()["products"]
+
+    product.name = "Siemens"
+    db.session.commit()
+    assert not client.get("/products/search?q=nok").get_json()["products"]
+    assert client.get("/products/search?q=siem").get_json()["products"]
+
+    db.session.delete(product)
+    db.session.commit()
+    assert not client.get("/products/search?q=siem").get_json()["products"]
+
+
+def test_search_requires_query(client):
+    response = client.get("/products/search?q=")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid query"
+    assert client.get("/products/search?q=%22*").get_json() == {"products": []}
+
+
+def test_rebuild_search_index(app):
+    db.session.execute(
+        db.insert(Product), [{"name": "Indexed", "title": "t", "price": 1}]
+    )
+    db.session.execute(db.text("DELETE FROM products_fts"))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-search-index"])
+    assert result.exit_code == 0
+    response = app.test_client().get("/products/search?q=index")
+    assert [item["name"] for item in response.get_json()["products"]] == ["Indexed"]
+
+
+def test_product_list_conditional_get(client):
+    products = _seed_products(3)
+
+    response = client.get("/products/product-list")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+    assert response.headers["Last-Modified"]
+
+    response = client.get("/products/product-list", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["X-Query-Count"] == "1"
+
+    # Другой набор параметров - другой ETag
+    response = client.get(
+        "/products/product-list?limit=1", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+    response = client.get(
+        "/products/product-list",
+        headers={"If-Modified-Since": response.headers["Last-Modified"]},
+    )
+    assert response.status_code == 304
+
+    products[0].price = 999
+    db.session.commit()
+    response = client.get("/products/product-list", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_product_list_validators_come_from_the_page(client):
+    products = _seed_products(5)
+    url = "/products/product-list?limit=2"
+
+    statements = _count_statements(lambda: client.get(url))
+    assert len(statements) == 1
+    assert "count(" not in statements[0].lower()
+    etag = client.get(url).headers["ETag"]
+
+    # Изменение продукта за пределами страницы ETag не меняет
+    products[4].price = 999
+    db.session.commit()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    products[0].price = 999
+    db.session.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # Удаление строки со страницы сдвигает ее и меняет ETag
+    db.session.delete(products[1])
+    db.session.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "updated_at" not in response.get_json()["products"][0]
+
+
+def test_get_single_product(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    product = _seed_products(1, category_id=category.id)[0]
+
+    response = client.get(f"/products/product/{product.id}")
+    assert response.status_code == 200
+    assert response.get_json()["name"] == product.name
+    assert response.get_json()["category_id"] == category.id
+
+    response = client.get(
+        f"/products/product/{product.id}",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    response = client.get("/products/product/999")
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "Product not found"
+
+
+def test_response_cache_invalidated_per_category(client, monkeypatch):
+    monkeypatch.setattr(response_cache, "max_bytes", 1_000_000)
+    electronics, phones, laptops, android, food = _seed_category_tree()
+    _seed_products(2, category_id=phones.id)
+    _seed_products(2, category_id=food.id)
+    phones_url = f"/products/product-list?category_id={phones.id}"
+    tree_url = f"/products/category/{electronics.id}/products?include_descendants=1"
+
+    def query_count(url):
+        return int(client.get(url).headers["X-Query-Count"])
+
+    for url in (phones_url, tree_url, "/products/product-list"):
+        assert client.get(url).status_code == 200
+        assert query_count(url) == 0
+
+    # Запись в другую категорию не трогает ответы по phones
+    db.session.add(Product(name="Apple", title="t", price=1, category_id=food.id))
+    db.session.commit()
+    assert query_count(phones_url) == 0
+    assert query_count(tree_url) <= 1
+    assert query_count("/products/product-list") == 1
+
+    # Продукт в подкатегории сбрасывает и ответ по поддереву
+    db.session.add(Product(name="Pixel", title="t", price=1, category_id=android.id))
+    db.session.commit()
+    assert query_count(phones_url) == 0
+    response = client.get(tree_url)
+    assert int(response.headers["X-Query-Count"]) >= 2
+    assert "Pixel" in [item["name"] for item in response.get_json()["products"]]
+
+    # Параметры в другом порядке попадают в тот же ключ
+    response = client.get(f"/products/product-list?category_id={phones.id}&limit=5")
+    assert response.headers["X-Query-Count"] == "1"
+    response = client.get(f"/products/product-list?limit=5&category_id={phones.id}")
+    assert response.headers["X-Query-Count"] == "0"
+
+
+def test_response_cache_byte_budget():
+    cache = ResponseCache(max_bytes=10)
+    cache.set("a", b"12345", "e1", None, {"category:1"})
+    cache.set("b", b"12345", "e2", None, {"category:2"})
+    cache.get("a")
+    cache.set("c", b"123", "e3", None, {"category:3"})
+    assert cache.get("b") is None
+    assert cache.get("a").etag == "e1"
+    assert cache.size == 8
+
+    cache.set("big", b"x" * 11, "e4", None, set())
+    assert cache.get("big") is None
+
+    cache.invalidate({"category:1"})
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+
+def test_metrics_endpoint(client):
+    _seed_products(3)
+    client.get("/products/product-list")
+    client.get("/products/product-list")
+    client.get("/products/product/999")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    labels = 'method="GET",endpoint="products.product_list"'
+    assert f'http_requests_total{{{labels},status="200"}} 2' in text
+    assert (
+        'http_requests_total{method="GET",endpoint="products.get_product",'
+        'status="404"} 1' in text
+    )
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"http_request_duration_seconds_count{{{labels}}} 2" in text
+    assert f"http_request_db_statements_total{{{labels}}} 2" in text
+    assert f"http_response_size_bytes_total{{{labels}}} 0" not in text
+    # Сам /metrics в счетчики не попадает
+    assert 'endpoint="metrics"' not in text
+
+
+def test_server_timing_header(client):
+    response = client.get("/products/categories")
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith("app;dur=")
+    assert "db;dur=" in timing and 'desc="1 queries"' in timing
+
+
+def test_xlsx_write_time_is_recorded(tmp_path):
+    metrics.reset()
+    queue = XlsxExportQueue(file_name=str(tmp_path / "products.xlsx"))
+    queue.enqueue(Product(id=1, name="A", title="t", price=1))
+    queue.flush()
+
+    text = metrics.render()
+    assert 'io_duration_seconds_count{operation="xlsx_export_write"} 1' in text
+
+
+def test_serving_options():
+    options = parse_options(
+        ["--workers", "3", "--worker-class", "gevent", "--max-requests", "1000"]
+    )
+    assert options["workers"] == 3
+    assert options["max_requests_jitter"] == 100
+
+    application = ShopApplication(options)
+    assert application.cfg.workers == 3
+    assert application.cfg.worker_class_str == "gevent"
+    assert application.cfg.post_fork is post_fork
+    assert parse_options([])["worker_class"] == "gevent"
+
+
+def test_gevent_worker_serves_requests(tmp_path):
+    pytest.importorskip("gevent")
+    import socket
+    import urllib.request
+
+    db_path = tmp_path / "shop.db"
+    setup = create_app(TEST_CONFIG, SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}")
+    with setup.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(
+        os.environ,
+        SECRET_KEY="smoke",
+        JWT_SECRET_KEY="smoke",
+        DATABASE_URL=f"sqlite:///{db_path}",
+        XLSX_EXPORT_FILE=str(tmp_path / "product_list.xlsx"),
+    )
+    # Класс воркера по умолчанию - gevent
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serving", "--workers", "1"]
+        + ["--bind", f"127.0.0.1:{port}"],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+    def call(path, data=None):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}{path}",
+            data=json.dumps(data).encode() if data is not None else None,
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read() or b"null")
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                status, _ = call("/products/categories")
+                break
+            except OSError:
+                assert server.poll() is None, server.stderr.read().decode()
+                assert time.monotonic() < deadline, "gunicorn did not start"
+                time.sleep(0.2)
+        assert status == 200
+
+        credentials = {"email": "smoke@mail.ru", "password": "smoke12345"}
+        status, _ = call("/users/buyer-create", dict(credentials, username="smoke"))
+        assert status == 201
+        # Проверка пароля идет через пул хеширования под gevent
+        status, body = call("/users/login", credentials)
+        assert status == 201
+        assert body["access_token"]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _stats_from_scratch(category_id):
+    prices = [p.price for p in Product.query.filter_by(category_id=category_id)]
+    return {
+        "product_count": len(prices),
+        "min_price": min(prices) if prices else None,
+        "max_price": max(prices) if prices else None,
+        "avg_price": round(sum(prices) / len(prices), 2) if prices else None,
+    }
+
+
+def _stats(client, category_id):
+    response = client.get(f"/products/categories/{category_id}/stats")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "1"
+    data = response.get_json()
+    return {
+        key: data[key]
+        for key in ("product_count", "min_price", "max_price", "avg_price")
+    }
+
+
+def test_category_stats_follow_product_writes(client):
+    phones = Category(name="Phones")
+    laptops = Category(name="Laptops")
+    db.session.add_all([phones, laptops])
+    db.session.commit()
+    assert _stats(client, phones.id) == _stats_from_scratch(phones.id)
+
+    cheap, middle, expensive = (
+        Product(name=name, title="t", price=price, category_id=phones.id)
+        for name, price in (("A", 100), ("B", 200), ("C", 300))
+    )
+    db.session.add_all([cheap, middle, expensive])
+    db.session.commit()
+    assert _stats(client, phones.id) == {
+        "product_count": 3,
+        "min_price": 100,
+        "max_price": 300,
+        "avg_price": 200.0,
+    }
+
+    # Цена максимума падает - максимум перечитывается по индексу
+    expensive.price = 150
+    db.session.commit()
+    assert _stats(client, phones.id)["max_price"] == 200
+
+    cheap.category_id = laptops.id
+    db.session.commit()
+    assert _stats(client, phones.id) == _stats_from_scratch(phones.id)
+    assert _stats(client, laptops.id) == _stats_from_scratch(laptops.id)
+
+    db.session.delete(middle)
+    db.session.commit()
+    assert _stats(client, phones.id) == _stats_from_scratch(phones.id)
+
+    response = client.get("/products/categories/999/stats")
+    assert response.status_code == 404
+
+
+def test_product_price_history(client):
+    product = Product(name="A", title="t", price=100)
+    db.session.add(product)
+    db.session.commit()
+    product.price = 120
+    db.session.commit()
+    product.name = "B"
+    db.session.commit()
+    product.price = 90
+    db.session.commit()
+
+    response = client.get(f"/products/product/{product.id}/price-history")
+    assert response.status_code == 200
+    assert [row["price"] for row in response.get_json()["history"]] == [100, 120, 90]
+
+    db.session.delete(product)
+    db.session.commit()
+    assert ProductPriceHistory.query.count() == 0
+    assert (
+        client.get(f"/products/product/{product.id}/price-history").status_code == 404
+    )
+
+
+def test_import_and_category_delete_keep_stats(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    headers = _admin_headers(client)
+
+    content = "name,title,price,category_id\n" + "".join(
+        f"P{i},t,{100 + i},{category.id}\n" for i in range(5)
+    )
+    response = client.post(
+        "/products/import",
+        data={"file": (io.BytesIO(content.encode()), "feed.csv")},
+        headers=headers,
+    )
+    assert response.get_json()["inserted"] == 5
+    assert _stats(client, category.id) == _stats_from_scratch(category.id)
+    assert ProductPriceHistory.query.count() == 5
+
+    category_id = category.id
+    response = client.delete(f"/products/categories/{category_id}", headers=headers)
+    assert response.status_code == 200
+    purge_worker.run()
+    assert db.session.get(CategoryStats, category_id) is None
+
+
+def test_rebuild_category_stats(app):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    db.session.execute(
+        db.insert(Product),
+        [{"name": "A", "title": "t", "price": 10, "category_id": category.id}],
+    )
+    db.session.execute(db.delete(CategoryStats))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["rebuild-category-stats"])
+    assert result.exit_code == 0
+    stats = db.session.get(CategoryStats, category.id)
+    assert (stats.product_count, stats.min_price, stats.max_price) == (1, 10, 10)
+
+
+def test_create_app_config_sources(monkeypatch):
+    app = create_app(TEST_CONFIG, DB_POOL_SIZE=3)
+    assert app.config["SECRET_KEY"] == "test"
+    assert app.config["DB_POOL_SIZE"] == 3
+    # Остальное берется из DefaultConfig
+    assert app.config["PERMISSION_CACHE_TTL"] == 300.0
+
+    monkeypatch.setenv("SECRET_KEY", "from-env")
+    monkeypatch.setenv("JWT_SECRET_KEY", "jwt")
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///:memory:")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "False")
+    monkeypatch.setenv("LOGIN_RATE_LIMIT_WINDOW", "2.5")
+    values = env_config()
+    assert values["SECRET_KEY"] == "from-env"
+    assert values["SQLALCHEMY_DATABASE_URI"] == "sqlite:///:memory:"
+    assert values["DB_POOL_PRE_PING"] is False
+    assert values["LOGIN_RATE_LIMIT_WINDOW"] == 2.5
+    assert values["DB_POOL_SIZE"] == 10
+
+
+def test_create_app_defers_heavy_imports():
+    code = (
+        "import sys\n"
+        "from app import create_app\n"
+        "create_app({'SECRET_KEY': 'x', 'JWT_SECRET_KEY': 'y',"
+        " 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})\n"
+        "print('openpyxl' in sys.modules, 'alembic' in sys.modules)\n"
+    )
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("SECRET_KEY", "JWT_SECRET_KEY", "DATABASE_URL")
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["False", "False"]
+
+
+def _buyer_headers(client, username="buyer"):
+    data = {
+        "username": username,
+        "email": f"{username}@mail.ru",
+        "password": "buyer12345",
+    }
+    client.post("/users/buyer-create", json=data)
+    response = client.post(
+        "/users/login", json={"email": data["email"], "password": data["password"]}
+    )
+    token = response.get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_checkout_from_cart(client):
+    phone = Product(name="Phone", title="t", price=100, stock=5)
+    case_ = Product(name="Case", title="t", price=10, stock=1)
+    db.session.add_all([phone, case_])
+    db.session.commit()
+    headers = _buyer_headers(client)
+
+    response = client.put(
+        f"/orders/cart/items/{phone.id}", json={"quantity": 2}, headers=headers
+    )
+    assert response.status_code == 200
+    client.put(f"/orders/cart/items/{case_.id}", json={"quantity": 1}, headers=headers)
+    assert client.get("/orders/cart", headers=headers).get_json()["items"] == [
+        {"product_id": phone.id, "quantity": 2},
+        {"product_id": case_.id, "quantity": 1},
+    ]
+
+    response = client.post("/orders/checkout", headers=headers)
+    assert response.status_code == 201
+    order = response.get_json()["order"]
+    assert order["total"] == 210
+    assert order["items"] == [
+        {"product_id": phone.id, "quantity": 2, "price": 100},
+        {"product_id": case_.id, "quantity": 1, "price": 10},
+    ]
+    assert client.get("/orders/cart", headers=headers).get_json()["items"] == []
+
+    db.session.expire_all()
+    assert (phone.stock, case_.stock) == (3, 0)
+    response = client.get(f"/orders/{order['id']}", headers=headers)
+    assert response.get_json() == order
+    assert response.headers["X-Query-Count"] == "2"
+
+    # Чужой заказ не отдаем
+    other = _buyer_headers(client, "other")
+    assert client.get(f"/orders/{order['id']}", headers=other).status_code == 404
+
+
+def test_checkout_is_all_or_nothing(client):
+    phone = Product(name="Phone", title="t", price=100, stock=5)
+    case_ = Product(name="Case", title="t", price=10, stock=1)
+    db.session.add_all([phone, case_])
+    db.session.commit()
+    headers = _buyer_headers(client)
+
+    items = [
+        {"product_id": phone.id, "quantity": 1},
+        {"product_id": case_.id, "quantity": 2},
+    ]
+    response = client.post("/orders/checkout", json={"items": items}, headers=headers)
+    assert response.status_code == 409
+    assert response.get_json() == {
+        "error": "Insufficient stock",
+        "product_ids": [case_.id],
+    }
+    db.session.expire_all()
+    assert (phone.stock, case_.stock) == (5, 1)
+
+    items.append({"product_id": 999, "quantity": 1})
+    response = client.post("/orders/checkout", json={"items": items}, headers=headers)
+    assert response.status_code == 404
+    assert response.get_json()["product_ids"] == [999]
+
+    response = client.post(
+        "/orders/checkout", json={"items": [{"product_id": phone.id}]}, headers=headers
+    )
+    assert response.status_code == 201
+    assert response.headers["X-Query-Count"] == "3"
+    assert client.post("/orders/checkout", headers=headers).status_code == 400
+    assert (
+        client.post(
+            "/orders/checkout",
+            json={"items": [{"product_id": phone.id, "quantity": 0}]},
+            headers=headers,
+        ).status_code
+        == 400
+    )
+
+
+def test_parallel_checkouts_never_oversell(tmp_path):
+    shop = create_app(
+        TEST_CONFIG,
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'shop.db'}",
+    )
+    with shop.app_context():
+        db.create_all()
+        sku = Product(name="Limited", title="t", price=100, stock=50)
+        plenty = Product(name="Plenty", title="t", price=1, stock=1000)
+        db.session.add_all([sku, plenty])
+        db.session.commit()
+        sku_id, plenty_id = sku.id, plenty.id
+        headers = {"Authorization": f"Bearer {create_access_token(identity=1)}"}
+
+    items = [
+        {"product_id": sku_id, "quantity": 1},
+        {"product_id": plenty_id, "quantity": 1},
+    ]
+
+    def checkout(_):
+        return (
+            shop.test_client()
+            .post("/orders/checkout", json={"items": items}, headers=headers)
+            .status_code
+        )
+
+    # Каждый поток берет свое соединение из пула файловой базы
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        statuses = list(pool.map(checkout, range(300)))
+
+    assert statuses.count(201) == 50
+    assert statuses.count(409) == 250
+    with shop.app_context():
+        assert db.session.get(Product, sku_id).stock == 0
+        # Заказы без нужного остатка откатываются целиком
+        assert db.session.get(Product, plenty_id).stock == 950
+        assert db.session.query(Order).count() == 50
+        assert db.session.query(OrderItem).count() == 100
+
+
+def test_idempotent_product_create(client, monkeypatch):
+    headers = _admin_headers(client)
+    enqueued = []
+    monkeypatch.setattr(xlsx_export, "enqueue", enqueued.append)
+    data = {"category_id": None, "name": "Pixel", "title": "t", "price": 100}
+    retry = dict(headers, **{"Idempotency-Key": "create-pixel"})
+
+    first = client.post("/products/product-create", json=data, headers=retry)
+    assert first.status_code == 201
+    assert first.headers["X-Query-Count"] == "6"
+
+    # Повтор отдается из кэша процесса, без запросов к базе
+    second = client.post("/products/product-create", json=data, headers=retry)
+    assert second.status_code == 201
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.headers["X-Query-Count"] == "0"
+    assert second.get_json() == first.get_json()
+
+    # Другой воркер: кэша нет, ответ берется из таблицы
+    idempotency_store.clear()
+    third = client.post("/products/product-create", json=data, headers=retry)
+    assert third.get_json() == first.get_json()
+    assert Product.query.count() == 1
+    assert len(enqueued) == 1
+
+    changed = dict(data, price=200)
+    response = client.post("/products/product-create", json=changed, headers=retry)
+    assert response.status_code == 422
+
+    response = client.post("/products/product-create", json=data, headers=headers)
+    assert response.status_code == 201
+    assert Product.query.count() == 2
+
+
+def test_idempotency_key_in_progress_and_expired(client):
+    now = datetime.utcnow()
+    key = "checkout-1"
+    headers = dict(_buyer_headers(client), **{"Idempotency-Key": key})
+    product = Product(name="Phone", title="t", price=100, stock=5)
+    db.session.add(product)
+    db.session.commit()
+    body = {"items": [{"product_id": product.id, "quantity": 1}]}
+
+    response = client.post("/orders/checkout", json=body, headers=headers)
+    assert response.status_code == 201
+    row = db.session.query(IdempotencyKey).one()
+    assert row.status_code == 201
+
+    # Первый запрос еще выполняется
+    idempotency_store.clear()
+    row.status_code, row.body = None, None
+    db.session.commit()
+    response = client.post("/orders/checkout", json=body, headers=headers)
+    assert response.status_code == 409
+
+    # Запрос, который так и не завершился, после таймаута выполняется заново
+    row.expires_at = now - timedelta(seconds=1)
+    db.session.commit()
+    response = client.post("/orders/checkout", json=body, headers=headers)
+    assert response.status_code == 201
+    assert db.session.query(Order).count() == 2
+
+    db.session.query(IdempotencyKey).update({"expires_at": now - timedelta(days=1)})
+    db.session.commit()
+    assert idempotency_store.purge_expired() == 1
+    assert db.session.query(IdempotencyKey).count() == 0
+
+
+def test_idempotency_key_released_on_server_error(app, client):
+    calls = []
+
+    @app.route("/flaky", methods=["POST"])
+    @idempotent
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            return jsonify({"error": "boom"}), 500
+        return jsonify({"ok": True}), 201
+
+    headers = {"Idempotency-Key": "flaky"}
+    assert client.post("/flaky", headers=headers).status_code == 500
+    assert client.post("/flaky", headers=headers).status_code == 201
+    assert client.post("/flaky", headers=headers).status_code == 201
+    assert len(calls) == 2
+    assert client.post("/flaky", headers={"Idempotency-Key": ""}).status_code == 400
+
+
+def test_products_batch_keeps_request_order(client):
+    products = _seed_products(3)
+    first, second, third = (product.id for product in products)
+
+    response = client.get(f"/products/batch?ids={third},999,{first},{third}")
+    assert response.status_code == 200
+    assert response.headers["X-Query-Count"] == "1"
+    payload = response.get_json()
+    assert [item and item["id"] for item in payload["products"]] == [
+        third,
+        None,
+        first,
+    ]
+    assert payload["missing"] == [999]
+    assert payload["products"][0]["name"] == products[2].name
+
+    response = client.get(f"/products/batch?ids={second}&ids={first}")
+    assert [item["id"] for item in response.get_json()["products"]] == [
+        second,
+        first,
+    ]
+
+    assert client.get("/products/batch").status_code == 400
+    assert client.get("/products/batch?ids=1,x").status_code == 400
+    for bad_id in ("0", "-1", str(2**31), "99999999999999999999"):
+        response = client.get(f"/products/batch?ids=1,{bad_id}")
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Invalid ids"
+    assert client.get(f"/users/batch?ids={2**31}").status_code == 400
+    ids = ",".join(str(i) for i in range(1, 102))
+    assert client.get(f"/products/batch?ids={ids}").status_code == 400
+
+
+def test_users_batch_and_identity_cache(app, client):
+    client.post(
+        "/users/buyer-create",
+        json={"username": "u1", "email": "u1@mail.ru", "password": "secret123"},
+    )
+    user = User.query.filter_by(username="u1").one()
+
+    response = client.get(f"/users/batch?ids=404,{user.id}")
+    assert response.get_json() == {
+        "users": [None, user.to_dict()],
+        "missing": [404],
+    }
+
+    with app.test_request_context(f"/users/batch?ids={user.id}"):
+        statements = _count_statements(
+            lambda: [get_by_ids(USER_COLUMNS, [user.id, 404]) for _ in range(3)]
+        )
+    assert len(statements) == 1
+
+
+def test_category_subtree_soft_deleted_then_purged(client, monkeypatch):
+    electronics, phones, laptops, android, food = _seed_category_tree()
+    ids = [category.id for category in (electronics, phones, laptops, android)]
+    food_id = food.id
+    db.session.add_all(
+        [
+            Product(name="Pixel", title="t", price=10, category_id=android.id),
+            Product(name="MacBook", title="t", price=20, category_id=laptops.id),
+            Product(name="Apple", title="t", price=1, category_id=food.id),
+        ]
+    )
+    db.session.commit()
+
+    response = client.delete(
+        f"/products/categories/{electronics.id}", headers=_admin_headers(client)
+    )
+    assert response.status_code == 200
+    assert [cat["name"] for cat in client.get("/products/categories").get_json()] == [
+        "Food"
+    ]
+    response = client.get(f"/products/category/{ids[1]}/products")
+    assert response.status_code == 404
+    assert client.get(f"/products/categories/{ids[1]}/stats").status_code == 404
+    assert [
+        p["name"] for p in client.get("/products/product-list").get_json()["products"]
+    ] == ["Apple"]
+
+    # Удаляем порциями по две строки, листья поддерева раньше родителей
+    monkeypatch.setattr(purge_worker, "batch_size", 2)
+    monkeypatch.setattr(purge_worker, "pause", 0)
+    assert purge_worker.run() == 6
+
+    remaining = db.session.execute(
+        db.select(Category.id).execution_options(include_deleted=True)
+    ).scalars()
+    assert list(remaining) == [food_id]
+    assert [
+        p["name"] for p in client.get("/products/product-list").get_json()["products"]
+    ] == ["Apple"]
+    assert db.session.query(CategoryStats).count() == 1
+    assert purge_worker.run() == 0
+
+
+def test_delete_category_requires_permission(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    db.session.add(Product(name="A", title="t", price=1, category_id=category.id))
+    db.session.commit()
+    category_id = category.id
+
+    response = client.delete(f"/products/categories/{category_id}")
+    assert response.status_code == 401
+    response = client.delete(
+        f"/products/categories/{category_id}", headers=_buyer_headers(client)
+    )
+    assert response.status_code == 403
+    assert db.session.get(Category, category_id).deleted_at is None
+    assert client.get("/products/product-list").get_json()["products"]
+
+
+def test_product_soft_delete(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    headers = _admin_headers(client)
+    cheap = Product(name="Cheap", title="t", price=10, category_id=category.id)
+    pricey = Product(
+        name="Pricey", title="t", price=90, stock=1, category_id=category.id
+    )
+    db.session.add_all([cheap, pricey])
+    db.session.commit()
+    category_id, cheap_id, pricey_id = category.id, cheap.id, pricey.id
+
+    body = {"items": [{"product_id": pricey_id, "quantity": 1}]}
+    buyer = _buyer_headers(client)
+    assert client.post("/orders/checkout", json=body, headers=buyer).status_code == 201
+
+    response = client.delete(f"/products/product/{pricey_id}", headers=headers)
+    assert response.status_code == 200
+    assert client.get(f"/products/product/{pricey_id}").status_code == 404
+    assert client.get(f"/products/batch?ids={pricey_id}").get_json()["missing"] == [
+        pricey_id
+    ]
+    assert [
+        p["id"] for p in client.get("/products/product-list").get_json()["products"]
+    ] == [cheap_id]
+    assert _stats(client, category_id)["max_price"] == 10
+    assert _stats(client, category_id) == _stats_from_scratch(category_id)
+    response = client.delete(f"/products/product/{pricey_id}", headers=headers)
+    assert response.status_code == 404
+
+    assert purge_worker.run() == 1
+    assert ProductPriceHistory.query.filter_by(product_id=pricey_id).count() == 0
+    # Заказ остается, позиция теряет только ссылку на продукт
+    item = db.session.query(OrderItem).one()
+    assert (item.product_id, item.price) == (None, 90)
+
+
+def test_list_indexes_are_partial(app):
+    rows = db.session.execute(
+        db.text("SELECT sql FROM sqlite_master WHERE name = 'ix_products_price_id'")
+    ).scalar()
+    assert rows.endswith("WHERE deleted_at IS NULL")
+
+    plan = db.session.execute(
+        db.text(
+            "EXPLAIN QUERY PLAN SELECT id FROM products "
+            "WHERE deleted_at IS NULL ORDER BY price, id LIMIT 10"
+        )
+    ).all()
+    assert "ix_products_price_id" in " ".join(row[-1] for row in plan)
+
+
+def test_purge_worker_runs_in_background(tmp_path):
+    shop = create_app(
+        TEST_CONFIG,
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'shop.db'}",
+        PURGE_IN_BACKGROUND=True,
+    )
+    with shop.app_context():
+        db.create_all()
+        category = Category(name="Old")
+        db.session.add(category)
+        db.session.commit()
+        db.session.add(Product(name="A", title="t", price=1, category_id=category.id))
+        db.session.commit()
+        category_id = category.id
+
+    client = shop.test_client()
+    response = client.delete(
+        f"/products/categories/{category_id}", headers=_admin_headers(client)
+    )
+    assert response.status_code == 200
+
+    deadline = time.monotonic() + 5
+    while purge_worker.purged_total < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert purge_worker.purged_total == 2
+    with shop.app_context():
+        assert (
+            db.session.execute(
+                db.select(db.func.count()).select_from(Category.__table__)
+            ).scalar()
+            == 0
+        )
+
+
+def test_products_of_deleted_category_are_hidden(client):
+    category = Category(name="Phones")
+    db.session.add(category)
+    db.session.commit()
+    product = Product(
+        name="Pixel", title="phone", price=10, stock=5, category_id=category.id
+    )
+    db.session.add(product)
+    db.session.commit()
+    category_id, product_id = category.id, product.id
+    headers = _buyer_headers(client)
+
+    response = client.delete(
+        f"/products/categories/{category_id}", headers=_admin_headers(client)
+    )
+    assert response.status_code == 200
+    db.session.expunge_all()
+
+    assert client.get("/products/product-list").get_json()["products"] == []
+    assert client.get("/products/search?q=pixel").get_json()["products"] == []
+    assert client.get(f"/products/product/{product_id}").status_code == 404
+    assert client.get(f"/products/batch?ids={product_id}").get_json()["missing"] == [
+        product_id
+    ]
+
+    body = {"items": [{"product_id": product_id, "quantity": 1}]}
+    response = client.post("/orders/checkout", json=body, headers=headers)
+    assert response.status_code == 404
+    stock = db.session.execute(
+        db.select(Product.stock)
+        .where(Product.id == product_id)
+        .execution_options(include_deleted=True)
+    ).scalar()
+    assert stock == 5